@@ -2,17 +2,30 @@ import streamlit as st
 import json
 import datetime
 import os
-from db_utils import init_db, get_session, get_loan_application, get_validation_result
+import queue
+import uuid
+from db_utils import init_db, get_session, get_operations_metrics
+from cache import get_cache_stats
+from llm_utils import get_llm_stats
+from config import STATES, OUTBOX_EMBEDDED_DISPATCHER, DEFAULT_TENANT
+from dispatcher import start_background_dispatcher
+from queries import get_loan_view
 from application_agent import ApplicationIntakeAgent
 from document_agent import DocumentVerificationAgent
 from protocol import A2AProtocol
+from scheduler import get_scheduler, INTERACTIVE
 from state_machine import LoanStateMachine
 
 # Initialize database
 init_db()
 
+# Agent handoffs are driven by the outbox; a standalone `python dispatcher.py`
+# can take over, and running both is safe because delivery is idempotent
+if OUTBOX_EMBEDDED_DISPATCHER:
+    start_background_dispatcher()
+
 # Initialize A2A protocol
-protocol = A2AProtocol()
+protocol = A2AProtocol(scheduler=get_scheduler())
 
 # Initialize state machine
 state_machine = LoanStateMachine()
@@ -45,13 +58,17 @@ if "messages" not in st.session_state:
 if "documents" not in st.session_state:
     st.session_state.documents = []
 
+# One idempotency key per application form, so resubmits map to the same loan
+if "submission_key" not in st.session_state:
+    st.session_state.submission_key = uuid.uuid4().hex
+
 # Main title
 st.title("AI Loan Processing System")
 st.markdown("### Multi-Agent System with A2A Communication")
 
 # Sidebar
 st.sidebar.header("Navigation")
-page = st.sidebar.radio("Go to", ["New Application", "Track Application"])
+page = st.sidebar.radio("Go to", ["New Application", "Track Application", "Operations"])
 
 if page == "New Application":
     st.header("New Loan Application")
@@ -111,42 +128,51 @@ if page == "New Application":
                     "loan_type": loan_type,
                     "loan_amount": loan_amount,
                     "loan_purpose": loan_purpose,
-                    "loan_term": loan_term
+                    "loan_term": loan_term,
+                    "tenant_id": DEFAULT_TENANT,
+                    "idempotency_key": st.session_state.submission_key
                 }
                 
-                # Process application through agent
-                result = application_agent.process(application_data)
+                # Process application through agent, streaming validation progress
+                with st.status("Validating application...", expanded=True) as validation_status:
+                    def show_validation_field(name, value):
+                        if name == "is_valid":
+                            st.write("Decision: " + ("looks valid" if value else "issues found"))
+                        elif name == "overall_assessment":
+                            st.write(f"Assessment: {value}")
+                        else:
+                            st.write(f"Checked {name.replace('_', ' ')}")
+                    
+                    # The agent runs on a scheduler worker; Streamlit can only write
+                    # from this thread, so streamed fields are relayed through a queue
+                    field_queue = queue.Queue()
+                    future = protocol.submit_agent(
+                        application_agent_id,
+                        "validate_application_form",
+                        application_data,
+                        tenant_id=DEFAULT_TENANT,
+                        priority=INTERACTIVE,
+                        on_field=lambda name, value: field_queue.put((name, value))
+                    )
+                    while not (future.done() and field_queue.empty()):
+                        try:
+                            show_validation_field(*field_queue.get(timeout=0.1))
+                        except queue.Empty:
+                            pass
+                    result = future.result()
+                    validation_status.update(
+                        label="Validation complete" if result["status"] == "success" else "Validation failed",
+                        state="complete" if result["status"] == "success" else "error"
+                    )
                 
                 if result["status"] == "success":
                     st.session_state.loan_application_id = result["loan_application_id"]
                     st.session_state.current_step = "document_upload"
+                    st.session_state.submission_key = uuid.uuid4().hex
                     st.success(f"Application submitted successfully! Loan Application ID: {result['loan_application_id']}")
                     
-                    # Create a task for document verification
-                    document_task_id = protocol.create_task(
-                        task_type="DOCUMENT_VERIFICATION_NEEDED",
-                        data={"loan_application_id": result["loan_application_id"]},
-                        initiator_agent_id=application_agent_id
-                    )
-                    
-                    # Assign to document agent
-                    protocol.assign_task(document_task_id, document_agent_id)
-                    
-                    # Send message from application agent to document agent
-                    message_content = {
-                        "message_type": "DOCUMENT_VERIFICATION_NEEDED",
-                        "loan_application_id": result["loan_application_id"],
-                        "applicant_name": applicant_name,
-                        "loan_type": loan_type,
-                        "loan_amount": loan_amount
-                    }
-                    
-                    response = protocol.send_message(
-                        sender_agent_id=application_agent_id,
-                        recipient_agent_id=document_agent_id,
-                        task_id=document_task_id,
-                        content=message_content
-                    )
+                    # The handoff to document verification is dispatched from the
+                    # outbox event written with the INITIAL_VALIDATION transition
                     
                     # Add communication to messages
                     comm_message = {
@@ -202,25 +228,79 @@ elif page == "Track Application":
     application_id = st.text_input("Enter your Application ID")
     
     if st.button("Check Status"):
-        loan_app = get_loan_application(application_id)
-        validation_result = get_validation_result(application_id)
+        loan_view = get_loan_view(application_id) if application_id.strip().isdigit() else None
         
-        if loan_app:
+        if loan_view:
+            validation_result = loan_view["validation_assessment"]
             st.success(f"Application Found: {application_id}")
             
             # Status Overview
             col1, col2 = st.columns(2)
             with col1:
-                st.metric("Current State", loan_app.current_state)
+                st.metric("Current State", loan_view["current_state"])
             with col2:
                 st.metric("Validation Assessment", validation_result or "Pending")
             
             # Detailed Validation Report
             with st.expander("Full Validation Details"):
-                if validation_result:
+                if loan_view["latest_validation"]:
                     st.write(f"**Overall Assessment**: {validation_result}")
-                    # Add more fields as needed from output_data
+                    st.json(loan_view["latest_validation"])
                 else:
                     st.warning("No validation assessment available yet")
+            
+            with st.expander("Documents"):
+                if loan_view["documents"]:
+                    for doc in loan_view["documents"]:
+                        st.write(f"{doc['document_type']} - Status: {doc['verification_status'] or 'Pending'}")
+                else:
+                    st.write("No documents on file yet")
+            
+            with st.expander("State History"):
+                for entry in loan_view["state_history"]:
+                    st.write(f"{entry['timestamp']}: {entry['state']}")
         else:
             st.error("Application not found")
+
+elif page == "Operations":
+    st.header("Operations Dashboard")
+    if st.button("Refresh"):
+        st.rerun()
+    
+    metrics = get_operations_metrics()
+    st.caption(f"Generated at {metrics['generated_at']} UTC")
+    
+    st.subheader("Queue Depth by State")
+    st.bar_chart({state: metrics["queue_depth"].get(state, 0) for state in STATES})
+    
+    st.subheader("Stage Dwell Times")
+    st.dataframe([
+        {
+            "State": state,
+            "Exits": stats["exits"],
+            "Avg (s)": round(stats["avg_seconds"], 1) if stats["avg_seconds"] is not None else None,
+            "Max (s)": round(stats["max_seconds"], 1)
+        }
+        for state, stats in metrics["dwell_times"].items()
+    ])
+    
+    st.subheader("Agent Error Rates")
+    st.dataframe([
+        {
+            "Agent": row["agent_name"],
+            "Interaction": row["interaction_type"],
+            "Total": row["total"],
+            "Errors": row["errors"],
+            "Error Rate": f"{row['error_rate']:.1%}" if row["error_rate"] is not None else "-",
+            "Tokens": row["prompt_tokens"] + row["completion_tokens"]
+        }
+        for row in metrics["agents"]
+    ])
+    
+    with st.expander("This Server Process"):
+        st.write("**LLM calls**")
+        st.json(get_llm_stats())
+        st.write("**Loan view cache**")
+        st.json(get_cache_stats())
+        st.write("**Agent scheduler**")
+        st.json(get_scheduler().stats())
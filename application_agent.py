@@ -1,6 +1,13 @@
 from base_agent import BaseAgent
-from llm_utils import process_structured_output
-from db_utils import create_applicant, create_loan_application, update_loan_application_state
+from llm_utils import process_structured_output, track_token_usage
+from prompts import get_system_prompt, build_validation_prompt
+from schemas import ApplicationValidation, LLM_ERROR_MESSAGE
+from db_utils import (
+    create_applicant, create_loan_application, update_loan_application_state,
+    find_duplicate_application, DuplicateApplicationError
+)
+from dedup import submission_fingerprint
+from config import DUPLICATE_WINDOW_HOURS
 
 class ApplicationIntakeAgent(BaseAgent):
     def __init__(self):
@@ -16,13 +23,28 @@ class ApplicationIntakeAgent(BaseAgent):
             "perform_initial_eligibility_check"
         ]
     
-    def process(self, input_data, loan_application_id=None):
-        """Process a new loan application"""
+    def process(self, input_data, loan_application_id=None, on_field=None):
+        """Process a new loan application
+
+        on_field(name, value) is called with each validation field as the
+        LLM response streams in, so callers can show progress early. Its
+        return value is ignored: the full response is always read and
+        validated before a decision is made.
+        """
         
         # For a new application, input_data is the application form
         if not loan_application_id:
+            # Retries and double submits return the existing loan before any LLM call or write
+            input_data = dict(input_data)
+            idempotency_key = input_data.pop("idempotency_key", None)
+            dedup_hash = submission_fingerprint(input_data)
+            existing_id = find_duplicate_application(idempotency_key, dedup_hash, DUPLICATE_WINDOW_HOURS)
+            if existing_id:
+                return self._duplicate_result(existing_id)
+            
             # Validate the application data
-            validation_result = self._validate_application(input_data)
+            with track_token_usage() as token_usage:
+                validation_result = self._validate_application(input_data, on_field=on_field)
             
             if validation_result["is_valid"]:
                 # Create applicant record
@@ -39,14 +61,19 @@ class ApplicationIntakeAgent(BaseAgent):
                 )
                 
                 # Create loan application
-                loan_application_id = create_loan_application(
-                    applicant_id=applicant_id,
-                    loan_type=input_data.get("loan_type"),
-                    loan_amount=input_data.get("loan_amount"),
-                    loan_purpose=input_data.get("loan_purpose"),
-                    loan_term=input_data.get("loan_term"),
-                    application_data=input_data
-                )
+                try:
+                    loan_application_id = create_loan_application(
+                        applicant_id=applicant_id,
+                        loan_type=input_data.get("loan_type"),
+                        loan_amount=input_data.get("loan_amount"),
+                        loan_purpose=input_data.get("loan_purpose"),
+                        loan_term=input_data.get("loan_term"),
+                        application_data=input_data,
+                        idempotency_key=idempotency_key,
+                        dedup_hash=dedup_hash
+                    )
+                except DuplicateApplicationError as e:
+                    return self._duplicate_result(e.loan_application_id)
                 
                 # Update state to initial validation
                 update_loan_application_state(loan_application_id, "INITIAL_VALIDATION")
@@ -56,7 +83,8 @@ class ApplicationIntakeAgent(BaseAgent):
                     loan_application_id=loan_application_id,
                     interaction_type="APPLICATION_VALIDATION",
                     input_data=input_data,
-                    output_data=validation_result
+                    output_data=validation_result,
+                    token_usage=token_usage
                 )
                 
                 # Return the result with loan_application_id
@@ -69,6 +97,16 @@ class ApplicationIntakeAgent(BaseAgent):
                 
                 return result
             else:
+                # No loan is created, but the LLM call was paid for; log it without one
+                self.log_interaction(
+                    loan_application_id=None,
+                    interaction_type="APPLICATION_VALIDATION",
+                    input_data=input_data,
+                    output_data=validation_result,
+                    notes="Rejected before a loan application was created",
+                    token_usage=token_usage
+                )
+                
                 # Return validation errors
                 return {
                     "status": "error",
@@ -84,45 +122,28 @@ class ApplicationIntakeAgent(BaseAgent):
                 "message": "Operation not supported for existing applications"
             }
     
-    def _validate_application(self, application_data):
+    def _duplicate_result(self, loan_application_id):
+        """Result returned for a submission that matches an existing loan"""
+        return {
+            "status": "success",
+            "message": "Application already submitted",
+            "loan_application_id": loan_application_id,
+            "duplicate": True
+        }
+    
+    def _validate_application(self, application_data, on_field=None):
         """Validate the application data using LLM"""
-        system_message = """
-        You are an AI assistant specializing in loan application validation. 
-        Please analyze the loan application data and check for:
-        1. Completeness of required fields
-        2. Basic eligibility criteria
-        3. Any inconsistencies or potential red flags
-        
-        Return a structured assessment of the application.
-        """
+        system_message = get_system_prompt("application_validation")
+        prompt = build_validation_prompt(application_data)
         
-        prompt = f"""
-        Please validate the following loan application data:
+        def report_field(name, value):
+            # Progress only; never stop the stream, a partial result is not a decision
+            on_field(name, value)
         
-        Application Data:
-        {application_data}
-        
-        Check for completeness, basic eligibility, and any inconsistencies.
-        """
-        
-        output_structure = {
-            "is_valid": True,
-            "completeness_check": {
-                "is_complete": True,
-                "missing_fields": []
-            },
-            "eligibility_check": {
-                "is_eligible": True,
-                "reasons": []
-            },
-            "consistency_check": {
-                "is_consistent": True,
-                "inconsistencies": []
-            },
-            "overall_assessment": ""
-        }
-        
-        result = process_structured_output(prompt, system_message, output_structure)
+        result = process_structured_output(
+            prompt, system_message, ApplicationValidation,
+            stream=on_field is not None, on_field=report_field if on_field else None
+        )
         
         if not result:
             # Default response if LLM fails
@@ -130,17 +151,17 @@ class ApplicationIntakeAgent(BaseAgent):
                 "is_valid": False,
                 "completeness_check": {
                     "is_complete": False,
-                    "missing_fields": ["Error processing application"]
+                    "missing_fields": [LLM_ERROR_MESSAGE]
                 },
                 "eligibility_check": {
                     "is_eligible": False,
-                    "reasons": ["Error processing application"]
+                    "reasons": [LLM_ERROR_MESSAGE]
                 },
                 "consistency_check": {
                     "is_consistent": False,
-                    "inconsistencies": ["Error processing application"]
+                    "inconsistencies": [LLM_ERROR_MESSAGE]
                 },
-                "overall_assessment": "Error processing application"
+                "overall_assessment": LLM_ERROR_MESSAGE
             }
         
         return result
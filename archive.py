@@ -0,0 +1,301 @@
+import datetime
+import json
+import os
+import sys
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import exists
+from sqlalchemy.orm import joinedload, selectinload
+from cache import invalidate_loan
+from config import ARCHIVE_DIR, ARCHIVE_AFTER_DAYS
+from metrics import record_loans_archived
+from outbox import delete_loan_events
+from models import (
+    Applicant, LoanApplication, Document, AgentInteraction, InteractionPayload, ArchivedLoan
+)
+
+# Completed loans are moved out of the OLTP tables into Parquet files laid
+# out as <ARCHIVE_DIR>/<table>/completed_month=YYYY-MM/<part>.parquet. The
+# archived_loans table is the manifest used to find a loan's files again.
+
+LOAN_SCHEMA = pa.schema([
+    ("loan_application_id", pa.int64()),
+    ("applicant_id", pa.int64()),
+    ("loan_type", pa.string()),
+    ("loan_amount", pa.float64()),
+    ("loan_purpose", pa.string()),
+    ("loan_term", pa.int64()),
+    ("interest_rate", pa.float64()),
+    ("current_state", pa.string()),
+    ("state_history", pa.string()),  # JSON
+    ("application_data", pa.string()),  # JSON
+    ("created_at", pa.timestamp("us")),
+    ("updated_at", pa.timestamp("us")),
+    ("applicant_name", pa.string()),
+    ("applicant_email", pa.string()),
+    ("applicant_phone", pa.string()),
+    ("applicant_address", pa.string()),
+    ("applicant_employment_status", pa.string()),
+    ("applicant_employer", pa.string()),
+    ("applicant_annual_income", pa.float64())
+])
+
+DOCUMENT_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("loan_application_id", pa.int64()),
+    ("document_type", pa.string()),
+    ("file_path", pa.string()),
+    ("verification_status", pa.string()),
+    ("verification_notes", pa.string()),
+    ("uploaded_at", pa.timestamp("us")),
+    ("verified_at", pa.timestamp("us"))
+])
+
+INTERACTION_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("loan_application_id", pa.int64()),
+    ("agent_name", pa.string()),
+    ("interaction_type", pa.string()),
+    ("input_data", pa.string()),  # JSON
+    ("output_data", pa.string()),  # JSON
+    ("overall_assessment", pa.string()),
+    ("is_error", pa.bool_()),
+    ("notes", pa.string()),
+    ("llm_model", pa.string()),
+    ("prompt_tokens", pa.int64()),
+    ("completion_tokens", pa.int64()),
+    ("cached_tokens", pa.int64()),
+    ("created_at", pa.timestamp("us"))
+])
+
+def _dumps(value):
+    return json.dumps(value, default=str) if value is not None else None
+
+def _loads(value):
+    return json.loads(value) if value else None
+
+def _part_path(archive_dir, table, partition, part_name):
+    return os.path.join(archive_dir, table, partition, part_name)
+
+def _loan_row(loan):
+    applicant = loan.applicant
+    return {
+        "loan_application_id": loan.id,
+        "applicant_id": loan.applicant_id,
+        "loan_type": loan.loan_type,
+        "loan_amount": loan.loan_amount,
+        "loan_purpose": loan.loan_purpose,
+        "loan_term": loan.loan_term,
+        "interest_rate": loan.interest_rate,
+        "current_state": loan.current_state,
+        "state_history": _dumps(loan.state_history),
+        "application_data": _dumps(loan.application_data),
+        "created_at": loan.created_at,
+        "updated_at": loan.updated_at,
+        "applicant_name": applicant.name if applicant else None,
+        "applicant_email": applicant.email if applicant else None,
+        "applicant_phone": applicant.phone if applicant else None,
+        "applicant_address": applicant.address if applicant else None,
+        "applicant_employment_status": applicant.employment_status if applicant else None,
+        "applicant_employer": applicant.employer if applicant else None,
+        "applicant_annual_income": applicant.annual_income if applicant else None
+    }
+
+def _document_row(document):
+    return {column.name: getattr(document, column.name) for column in DOCUMENT_SCHEMA}
+
+def _interaction_row(interaction):
+    return {
+        "id": interaction.id,
+        "loan_application_id": interaction.loan_application_id,
+        "agent_name": interaction.agent_name,
+        "interaction_type": interaction.interaction_type,
+        "input_data": _dumps(interaction.get_input_data()),
+        "output_data": _dumps(interaction.get_output_data()),
+        "overall_assessment": interaction.overall_assessment,
+        "is_error": interaction.is_error,
+        "notes": interaction.notes,
+        "llm_model": interaction.llm_model,
+        "prompt_tokens": interaction.prompt_tokens,
+        "completion_tokens": interaction.completion_tokens,
+        "cached_tokens": interaction.cached_tokens,
+        "created_at": interaction.created_at
+    }
+
+def _write_part(archive_dir, table, partition, part_name, rows, schema):
+    path = _part_path(archive_dir, table, partition, part_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows = sorted(rows, key=lambda row: row["loan_application_id"])
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), path, compression="zstd")
+
+def archive_completed_loans(session, cutoff_days=ARCHIVE_AFTER_DAYS, archive_dir=ARCHIVE_DIR, batch_size=1000):
+    """Move COMPLETED loans untouched for cutoff_days into Parquet, in batches
+
+    Files for a batch are written before its rows are deleted, so a crash
+    can leave an unreferenced file but never lose a loan. Returns the
+    number of loans archived.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=cutoff_days)
+    archived = 0
+    while True:
+        loans = session.query(LoanApplication).options(
+            joinedload(LoanApplication.applicant),
+            selectinload(LoanApplication.documents),
+            selectinload(LoanApplication.agent_interactions).joinedload(AgentInteraction.input_payload),
+            selectinload(LoanApplication.agent_interactions).joinedload(AgentInteraction.output_payload)
+        ).filter(
+            LoanApplication.current_state == "COMPLETED",
+            LoanApplication.updated_at < cutoff
+        ).order_by(LoanApplication.id).limit(batch_size).all()
+        if not loans:
+            return archived
+
+        partitions = {}
+        for loan in loans:
+            partition = f"completed_month={loan.updated_at:%Y-%m}"
+            partitions.setdefault(partition, []).append(loan)
+
+        part_name = f"part-{uuid.uuid4().hex}.parquet"
+        manifest = []
+        for partition, group in partitions.items():
+            _write_part(archive_dir, "loans", partition, part_name,
+                        [_loan_row(loan) for loan in group], LOAN_SCHEMA)
+            _write_part(archive_dir, "documents", partition, part_name,
+                        [_document_row(doc) for loan in group for doc in loan.documents], DOCUMENT_SCHEMA)
+            _write_part(archive_dir, "interactions", partition, part_name,
+                        [_interaction_row(i) for loan in group for i in loan.agent_interactions], INTERACTION_SCHEMA)
+            manifest.extend(
+                ArchivedLoan(
+                    loan_application_id=loan.id,
+                    applicant_id=loan.applicant_id,
+                    partition=partition,
+                    part_name=part_name,
+                    completed_at=loan.updated_at
+                )
+                for loan in group
+            )
+
+        loan_ids = [loan.id for loan in loans]
+        payload_hashes = {
+            content_hash
+            for loan in loans for interaction in loan.agent_interactions
+            for content_hash in (interaction.input_hash, interaction.output_hash) if content_hash
+        }
+        session.expunge_all()
+        session.add_all(manifest)
+        session.query(AgentInteraction).filter(
+            AgentInteraction.loan_application_id.in_(loan_ids)
+        ).delete(synchronize_session=False)
+        session.query(Document).filter(Document.loan_application_id.in_(loan_ids)).delete(synchronize_session=False)
+        session.query(LoanApplication).filter(LoanApplication.id.in_(loan_ids)).delete(synchronize_session=False)
+        delete_loan_events(session, loan_ids)
+        _delete_orphan_payloads(session, payload_hashes)
+        record_loans_archived(session, len(loan_ids))
+        session.commit()
+
+        for loan_id in loan_ids:
+            invalidate_loan(loan_id)
+        archived += len(loan_ids)
+        print(f"Archived {archived} loans")
+
+def _delete_orphan_payloads(session, content_hashes):
+    """Delete payloads no live interaction references any more"""
+    if not content_hashes:
+        return
+    session.query(InteractionPayload).filter(
+        InteractionPayload.content_hash.in_(content_hashes),
+        ~exists().where(AgentInteraction.input_hash == InteractionPayload.content_hash),
+        ~exists().where(AgentInteraction.output_hash == InteractionPayload.content_hash)
+    ).delete(synchronize_session=False)
+
+def _read_part(archive_dir, table, entry, loan_application_id):
+    path = _part_path(archive_dir, table, entry.partition, entry.part_name)
+    if not os.path.exists(path):
+        return []
+    # partitioning=None: the completed_month=... directory must not become a column
+    return pq.read_table(
+        path, filters=[("loan_application_id", "=", loan_application_id)], partitioning=None
+    ).to_pylist()
+
+def iter_archived_rows(session, table, columns, archive_dir=ARCHIVE_DIR):
+    """Yield rows of a table from every part in the manifest, reading only columns
+
+    Files that no manifest entry references (left by an interrupted run,
+    whose loans are still live) are skipped.
+    """
+    parts = session.query(ArchivedLoan.partition, ArchivedLoan.part_name).distinct().all()
+    for partition, part_name in parts:
+        path = _part_path(archive_dir, table, partition, part_name)
+        if not os.path.exists(path):
+            continue
+        for batch in pq.ParquetFile(path).iter_batches(columns=columns):
+            yield from batch.to_pylist()
+
+def load_archived_loan(session, loan_application_id, archive_dir=ARCHIVE_DIR):
+    """Return the archived rows for a loan as {"loan", "documents", "interactions"}, or None"""
+    loan_application_id = int(loan_application_id)
+    entry = session.get(ArchivedLoan, loan_application_id)
+    if entry is None:
+        return None
+    loans = _read_part(archive_dir, "loans", entry, loan_application_id)
+    if not loans:
+        return None
+    return {
+        "loan": loans[0],
+        "documents": _read_part(archive_dir, "documents", entry, loan_application_id),
+        "interactions": _read_part(archive_dir, "interactions", entry, loan_application_id)
+    }
+
+def archived_loan_to_orm(record):
+    """Rebuild transient (never persisted) ORM objects from an archived record"""
+    row = record["loan"]
+    loan = LoanApplication(
+        id=row["loan_application_id"],
+        applicant_id=row["applicant_id"],
+        loan_type=row["loan_type"],
+        loan_amount=row["loan_amount"],
+        loan_purpose=row["loan_purpose"],
+        loan_term=row["loan_term"],
+        interest_rate=row["interest_rate"],
+        current_state=row["current_state"],
+        state_history=_loads(row["state_history"]),
+        application_data=_loads(row["application_data"]),
+        created_at=row["created_at"],
+        updated_at=row["updated_at"]
+    )
+    loan.applicant = Applicant(
+        id=row["applicant_id"],
+        name=row["applicant_name"],
+        email=row["applicant_email"],
+        phone=row["applicant_phone"],
+        address=row["applicant_address"],
+        employment_status=row["applicant_employment_status"],
+        employer=row["applicant_employer"],
+        annual_income=row["applicant_annual_income"]
+    )
+    loan.documents = [Document(**document) for document in record["documents"]]
+    return loan
+
+def latest_archived_validation(record):
+    """Return the latest archived APPLICATION_VALIDATION as a transient interaction, or None"""
+    validations = [
+        interaction for interaction in record["interactions"]
+        if interaction["interaction_type"] == "APPLICATION_VALIDATION"
+    ]
+    if not validations:
+        return None
+    latest = max(validations, key=lambda interaction: interaction["id"])
+    return AgentInteraction(**dict(
+        latest, input_data=_loads(latest["input_data"]), output_data=_loads(latest["output_data"])
+    ))
+
+if __name__ == "__main__":
+    from db_utils import init_db, get_session
+    cutoff_days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    init_db()
+    session = get_session()
+    try:
+        print(f"Done: {archive_completed_loans(session, cutoff_days=cutoff_days)} loans archived")
+    finally:
+        session.close()
@@ -29,17 +29,20 @@ class BaseAgent(ABC):
         """Process input data and return output"""
         pass
     
-    def log_interaction(self, loan_application_id, interaction_type, input_data, output_data, notes=None):
-        """Log the agent interaction"""
-        if loan_application_id:
-            log_agent_interaction(
-                loan_application_id=loan_application_id,
-                agent_name=self.name,
-                interaction_type=interaction_type,
-                input_data=input_data,
-                output_data=output_data,
-                notes=notes
-            )
+    def log_interaction(self, loan_application_id, interaction_type, input_data, output_data, notes=None,
+                        token_usage=None, is_error=None, processed_event=None):
+        """Log the agent interaction (loan_application_id is None for requests rejected before a loan exists)"""
+        return log_agent_interaction(
+            loan_application_id=loan_application_id,
+            agent_name=self.name,
+            interaction_type=interaction_type,
+            input_data=input_data,
+            output_data=output_data,
+            notes=notes,
+            token_usage=token_usage,
+            is_error=is_error,
+            processed_event=processed_event
+        )
     
     def receive_message(self, message):
         """Receive a message from another agent"""
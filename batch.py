@@ -0,0 +1,279 @@
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from config import BATCH_MIN_CREDIT_SCORE, BATCH_MAX_DEBT_TO_INCOME, BATCH_LOAD_SIZE
+from models import Applicant, LoanApplication
+
+# Batch stages work on an ApplicationBatch: one Arrow table with a fixed
+# schema instead of a dict or ORM object per loan. Low-cardinality strings
+# are dictionary encoded, slices share buffers with their parent, and the
+# stages below are pyarrow.compute kernels over whole columns.
+
+CATEGORY = pa.dictionary(pa.int16(), pa.string())
+
+APPLICATION_BATCH_SCHEMA = pa.schema([
+    ("loan_application_id", pa.int64()),
+    ("applicant_id", pa.int64()),
+    ("applicant_name", pa.string()),
+    ("applicant_email", pa.string()),
+    ("employment_status", CATEGORY),
+    ("annual_income", pa.float64()),
+    ("monthly_debt", pa.float64()),
+    ("credit_score", pa.int64()),
+    ("loan_type", CATEGORY),
+    ("loan_amount", pa.float64()),
+    ("loan_term", pa.int64()),
+    ("interest_rate", pa.float64()),
+    ("current_state", CATEGORY),
+    ("created_at", pa.timestamp("us"))
+])
+
+REQUIRED_FIELDS = [
+    "applicant_name", "applicant_email", "employment_status", "annual_income",
+    "credit_score", "loan_type", "loan_amount", "loan_term"
+]
+
+class ApplicationBatch:
+    """Columnar batch of loan applications backed by a pyarrow Table"""
+
+    def __init__(self, table):
+        if not table.schema.equals(APPLICATION_BATCH_SCHEMA):
+            raise ValueError("Table does not match APPLICATION_BATCH_SCHEMA; use ApplicationBatch.from_arrow")
+        self.table = table
+
+    @classmethod
+    def from_arrow(cls, data):
+        """Wrap a Table or RecordBatch; columns already in the batch type are not copied
+
+        Missing columns become nulls and extra columns are dropped. Only
+        columns whose type differs from the schema are cast (and so copied).
+        """
+        if isinstance(data, pa.RecordBatch):
+            data = pa.Table.from_batches([data])
+        columns = []
+        for field in APPLICATION_BATCH_SCHEMA:
+            if field.name not in data.column_names:
+                columns.append(pa.chunked_array([pa.nulls(data.num_rows, field.type)]))
+                continue
+            column = data.column(field.name)
+            if column.type != field.type:
+                column = column.cast(field.type)
+            columns.append(column)
+        return cls(pa.Table.from_arrays(columns, schema=APPLICATION_BATCH_SCHEMA))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a batch from application dicts, e.g. application_data from app.py"""
+        return cls(pa.Table.from_pylist(list(rows), schema=APPLICATION_BATCH_SCHEMA))
+
+    @classmethod
+    def from_orm(cls, loans):
+        """Build a batch from LoanApplication objects (with their applicants)"""
+        columns = {field.name: [] for field in APPLICATION_BATCH_SCHEMA}
+        for loan in loans:
+            applicant = loan.applicant
+            data = loan.application_data or {}
+            values = {
+                "loan_application_id": loan.id,
+                "applicant_id": loan.applicant_id,
+                "applicant_name": applicant.name if applicant else data.get("applicant_name"),
+                "applicant_email": applicant.email if applicant else data.get("applicant_email"),
+                "employment_status": applicant.employment_status if applicant else data.get("employment_status"),
+                "annual_income": applicant.annual_income if applicant else data.get("annual_income"),
+                "monthly_debt": data.get("monthly_debt"),
+                "credit_score": data.get("credit_score"),
+                "loan_type": loan.loan_type,
+                "loan_amount": loan.loan_amount,
+                "loan_term": loan.loan_term,
+                "interest_rate": loan.interest_rate,
+                "current_state": loan.current_state,
+                "created_at": loan.created_at
+            }
+            for name, value in values.items():
+                columns[name].append(value)
+        return cls._from_columns(columns)
+
+    @classmethod
+    def _from_columns(cls, columns):
+        return cls(pa.Table.from_arrays(
+            [pa.array(columns[field.name], type=field.type) for field in APPLICATION_BATCH_SCHEMA],
+            schema=APPLICATION_BATCH_SCHEMA
+        ))
+
+    @classmethod
+    def iter_database(cls, session, states=None, batch_size=BATCH_LOAD_SIZE):
+        """Yield batches of loans straight from loan_applications, in id order
+
+        Columns are selected in SQL (credit_score and monthly_debt are
+        extracted from application_data there), so no ORM objects are built.
+        """
+        query = select(
+            LoanApplication.id,
+            LoanApplication.applicant_id,
+            Applicant.name,
+            Applicant.email,
+            Applicant.employment_status,
+            Applicant.annual_income,
+            LoanApplication.application_data["monthly_debt"].as_float(),
+            LoanApplication.application_data["credit_score"].as_integer(),
+            LoanApplication.loan_type,
+            LoanApplication.loan_amount,
+            LoanApplication.loan_term,
+            LoanApplication.interest_rate,
+            LoanApplication.current_state,
+            LoanApplication.created_at
+        ).outerjoin(Applicant, LoanApplication.applicant_id == Applicant.id)
+        if states:
+            query = query.where(LoanApplication.current_state.in_(states))
+        last_id = 0
+        while True:
+            rows = session.execute(
+                query.where(LoanApplication.id > last_id).order_by(LoanApplication.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            values = list(zip(*rows))
+            yield cls._from_columns({
+                field.name: values[index] for index, field in enumerate(APPLICATION_BATCH_SCHEMA)
+            })
+            last_id = rows[-1][0]
+
+    @classmethod
+    def from_database(cls, session, states=None, batch_size=BATCH_LOAD_SIZE):
+        """Load matching loans into one batch"""
+        batches = [batch.table for batch in cls.iter_database(session, states, batch_size)]
+        if not batches:
+            return cls(APPLICATION_BATCH_SCHEMA.empty_table())
+        return cls(pa.concat_tables(batches).unify_dictionaries())
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def column(self, name):
+        """Return a column as an Arrow array"""
+        return self.table.column(name)
+
+    def to_numpy(self, name, fill_value=None):
+        """Return a column as a NumPy array
+
+        Numeric columns without nulls in a single chunk are returned without
+        copying; nulls are replaced by fill_value (NaN for float columns).
+        """
+        column = self.table.column(name)
+        if column.null_count:
+            if fill_value is None and pa.types.is_floating(column.type):
+                fill_value = np.nan
+            if fill_value is not None:
+                column = pc.fill_null(column, fill_value)
+        if column.num_chunks == 1:
+            return column.chunk(0).to_numpy(zero_copy_only=False)
+        return column.to_numpy()
+
+    def slice(self, offset, length=None):
+        """Zero-copy view of rows [offset, offset + length)"""
+        return ApplicationBatch(self.table.slice(offset, length))
+
+    def iter_slices(self, size):
+        """Zero-copy views of consecutive chunks of at most size rows"""
+        for offset in range(0, len(self), size):
+            yield self.slice(offset, size)
+
+    def filter(self, mask):
+        """Rows where mask is true (copies the selected rows)"""
+        return ApplicationBatch(self.table.filter(mask))
+
+def debt_to_income(batch):
+    """Monthly debt over monthly income; null when either is unknown or income is zero"""
+    monthly_income = pc.divide(batch.column("annual_income"), 12.0)
+    monthly_income = pc.if_else(pc.greater(monthly_income, 0), monthly_income, None)
+    return pc.divide(batch.column("monthly_debt"), monthly_income)
+
+def validate_batch(batch, min_credit_score=BATCH_MIN_CREDIT_SCORE, max_debt_to_income=BATCH_MAX_DEBT_TO_INCOME):
+    """Rule-based pre-screen mirroring the checks in ApplicationValidation
+
+    Returns a table aligned with the batch: loan_application_id, is_complete,
+    is_eligible, is_consistent and is_valid. Unknown values fail a check.
+    """
+    is_complete = None
+    for name in REQUIRED_FIELDS:
+        present = pc.is_valid(batch.column(name))
+        if pa.types.is_string(batch.column(name).type):
+            present = pc.and_(present, pc.greater(pc.utf8_length(pc.utf8_trim_whitespace(batch.column(name))), 0))
+        is_complete = present if is_complete is None else pc.and_(is_complete, present)
+
+    credit_score = batch.column("credit_score")
+    is_eligible = pc.fill_null(pc.and_(
+        pc.greater_equal(credit_score, min_credit_score),
+        pc.less_equal(debt_to_income(batch), max_debt_to_income)
+    ), False)
+    is_consistent = pc.fill_null(pc.and_(
+        pc.and_(pc.greater_equal(credit_score, 300), pc.less_equal(credit_score, 850)),
+        pc.and_(
+            pc.greater(batch.column("loan_amount"), 0),
+            pc.and_(pc.greater_equal(batch.column("loan_term"), 12), pc.less_equal(batch.column("loan_term"), 360))
+        )
+    ), False)
+    is_complete = pc.fill_null(is_complete, False)
+    return pa.table({
+        "loan_application_id": batch.column("loan_application_id"),
+        "is_complete": is_complete,
+        "is_eligible": is_eligible,
+        "is_consistent": is_consistent,
+        "is_valid": pc.and_(is_complete, pc.and_(is_eligible, is_consistent))
+    })
+
+def score_batch(batch, max_debt_to_income=BATCH_MAX_DEBT_TO_INCOME):
+    """Risk score in [0, 1] (higher is better) from credit score and debt-to-income
+
+    Returns a table aligned with the batch: loan_application_id,
+    debt_to_income and score. The score is null when an input is unknown.
+    """
+    ratio = debt_to_income(batch)
+    credit = pc.divide(pc.subtract(pc.cast(batch.column("credit_score"), pa.float64()), 300.0), 550.0)
+    credit = pc.max_element_wise(pc.min_element_wise(credit, 1.0, skip_nulls=False), 0.0, skip_nulls=False)
+    headroom = pc.max_element_wise(pc.subtract(1.0, pc.divide(ratio, max_debt_to_income)), 0.0, skip_nulls=False)
+    return pa.table({
+        "loan_application_id": batch.column("loan_application_id"),
+        "debt_to_income": ratio,
+        "score": pc.add(pc.multiply(credit, 0.6), pc.multiply(headroom, 0.4))
+    })
+
+def export_batch(batch, path, *results):
+    """Write a batch and any aligned result tables to one Parquet file
+
+    Result columns are appended without copying; their loan_application_id
+    column is dropped since it duplicates the batch's.
+    """
+    table = batch.table
+    for result in results:
+        for name in result.column_names:
+            if name != "loan_application_id":
+                table = table.append_column(name, result.column(name))
+    pq.write_table(table, path, compression="zstd")
+    return table.num_rows
+
+if __name__ == "__main__":
+    from db_utils import init_db, get_session
+    parser = argparse.ArgumentParser(description="Validate, score and export loan applications in columnar batches")
+    parser.add_argument("output", help="Parquet file to write")
+    parser.add_argument("--state", action="append", help="only loans in this state (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_LOAD_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    session = get_session()
+    try:
+        batch = ApplicationBatch.from_database(session, args.state, args.batch_size)
+    finally:
+        session.close()
+    validation = validate_batch(batch)
+    print(f"Loaded {len(batch)} loans ({batch.nbytes} bytes), "
+          f"{pc.sum(validation.column('is_valid')).as_py() or 0} pass the pre-screen")
+    export_batch(batch, args.output, validation, score_batch(batch))
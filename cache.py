@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from config import LOAN_CACHE_SIZE
+
+_MISSING = object()
+
+class LRUCache:
+    """Bounded, thread-safe LRU cache with hit/miss/eviction counters"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, key, default=None):
+        """Return a cached value and mark it recently used"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if full"""
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Read-through lookup; None results are returned but not cached"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            generation = self._generation
+        value = loader()
+        if value is not None:
+            with self._lock:
+                # Skip the store if an invalidation raced with the load
+                if generation == self._generation:
+                    self._store(key, value)
+        return value
+
+    def invalidate(self, key):
+        """Drop a key so the next read goes to the database"""
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """Return size and hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None
+            }
+
+# Keyed by loan application id; status lookups are served from the view
+loan_view_cache = LRUCache(LOAN_CACHE_SIZE)
+
+def invalidate_loan(loan_application_id):
+    """Invalidate every cached read for a loan after a write"""
+    loan_view_cache.invalidate(int(loan_application_id))
+
+def get_cache_stats():
+    """Return metrics for each loan cache"""
+    return {
+        "loan_view": loan_view_cache.stats()
+    }
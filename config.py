@@ -10,10 +10,71 @@ OPENAI_API_KEY = st.secrets['OPENAI_API_KEY']
 
 # LLM Configuration
 MODEL_NAME = "gpt-4"
+FALLBACK_MODEL_NAME = "gpt-3.5-turbo"
+
+# LLM Resilience Configuration
+LLM_TIMEOUT = 60  # seconds per request
+LLM_MAX_RETRIES = 3  # retries after the first attempt
+LLM_HEDGE_PERCENTILE = 0.95  # duplicate a request still running at this latency percentile
+LLM_HEDGE_MIN_SAMPLES = 50  # timed calls needed per model before hedging starts
+LLM_HEDGE_POOL_SIZE = 16  # requests hedging can track; calls beyond this run unhedged
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 60  # seconds before a half-open probe
 
 # Database Configuration
 DATABASE_URL = "sqlite:///loan_processing.db"
 
+# Interaction Payload Storage
+PAYLOAD_COMPRESSION_THRESHOLD = 256  # bytes; smaller payloads are stored as plain JSON
+
+# Archival Configuration
+ARCHIVE_DIR = "archive"  # root of the partitioned Parquet archive
+ARCHIVE_AFTER_DAYS = 90  # completed loans untouched this long are archived
+
+# Duplicate Submission Detection
+DUPLICATE_WINDOW_HOURS = 24  # same applicant, amount and type within this window is a duplicate
+
+# Cache Configuration
+LOAN_CACHE_SIZE = 10000  # loans kept per read-through cache
+
+# Outbox Dispatcher Configuration
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_INTERVAL = 1.0  # seconds between polls when idle
+OUTBOX_LEASE_SECONDS = 60  # claimed events are redelivered if not finished in time
+OUTBOX_MAX_ATTEMPTS = 8  # then the event is parked as FAILED
+OUTBOX_EMBEDDED_DISPATCHER = True  # also run a dispatcher thread inside the Streamlit process
+OUTBOX_RETENTION_DAYS = 7  # dispatched events and processed markers are purged after this
+OUTBOX_PURGE_INTERVAL = 3600  # seconds between purges by a running dispatcher
+
+# Agent Scheduler Configuration
+SCHEDULER_WORKERS = 8
+SCHEDULER_INTERACTIVE_RESERVED = 2  # workers batch jobs may never occupy
+DEFAULT_TENANT = "direct"  # tenant for applications submitted through app.py
+TENANT_WEIGHTS = {"direct": 2}  # fair-share weights; unlisted tenants weigh 1
+TENANT_MAX_CONCURRENCY = {}  # per-tenant caps; unlisted tenants use the default
+DEFAULT_TENANT_MAX_CONCURRENCY = 4
+CAPABILITY_MAX_CONCURRENCY = {
+    "validate_application_form": 4,
+    "verify_identity_documents": 4
+}
+INTERACTIVE_SLO_SECONDS = 30  # target start latency for interactive jobs
+
+# Columnar Batch Configuration
+BATCH_LOAD_SIZE = 50000  # rows fetched per query when loading batches from the database
+BATCH_MIN_CREDIT_SCORE = 580  # pre-screen eligibility threshold
+BATCH_MAX_DEBT_TO_INCOME = 0.43  # monthly debt over monthly income
+
+# Decision Replay Configuration
+REPLAY_WORKERS = 32  # concurrent validations
+REPLAY_CHUNK_SIZE = 500  # interactions read per query
+REPLAY_REQUESTS_PER_SECOND = 50  # LLM request budget shared by all workers
+REPLAY_CACHE_PATH = "llm_cache.db"  # responses reused across replay runs
+REPLAY_REPORT_PATH = "replay_report.json"
+
+# Operations API Configuration
+OPS_API_HOST = "127.0.0.1"
+OPS_API_PORT = 8502
+
 # Application Configuration
 APP_NAME = "AI Loan Processing System"
 APP_DESCRIPTION = "Multi-agent system for loan application processing"
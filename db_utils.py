@@ -1,8 +1,20 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, func, inspect, text, and_, or_
+from sqlalchemy.orm import sessionmaker, joinedload
 import datetime
-from models import Base, Applicant, LoanApplication, Document, AgentInteraction
+from sqlalchemy.exc import IntegrityError
+from models import (
+    Base, Applicant, LoanApplication, Document, AgentInteraction, InteractionPayload,
+    PipelineStateCount, StageDwellStat, AgentOutcomeStat
+)
+from payloads import encode_payload
+from archive import load_archived_loan, archived_loan_to_orm, latest_archived_validation
 from config import DATABASE_URL
+from cache import invalidate_loan
+from outbox import enqueue_event, is_processed, record_processed
+from metrics import (
+    record_loan_created, record_transition, record_interaction, is_error_output,
+    parse_history_timestamp, get_pipeline_metrics, rebuild_pipeline_metrics
+)
 
 # Create engine and session
 engine = create_engine(DATABASE_URL)
@@ -13,9 +25,40 @@ def init_db():
     """Initialize the database, creating all tables"""
     global _initialized
     if not _initialized:
+        existing_tables = set(inspect(engine).get_table_names())
         Base.metadata.create_all(engine, checkfirst=True)
+        _add_missing_columns()
+        aggregate_tables = {model.__tablename__ for model in (PipelineStateCount, StageDwellStat, AgentOutcomeStat)}
+        if not aggregate_tables <= existing_tables:
+            # Aggregates added to a database that already has loans start from a backfill
+            session = get_session()
+            try:
+                rebuild_pipeline_metrics(session)
+            finally:
+                session.close()
         _initialized = True
 
+def _add_missing_columns():
+    """Add columns and indexes introduced after a table was first created"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+
+class DuplicateApplicationError(Exception):
+    """Raised when a submission reuses the idempotency key of an existing loan"""
+    def __init__(self, loan_application_id):
+        super().__init__(f"Duplicate of loan application {loan_application_id}")
+        self.loan_application_id = loan_application_id
+
 def get_session():
     """Get a new database session"""
     return Session()
@@ -50,8 +93,11 @@ def create_applicant(name, email, phone=None, address=None, date_of_birth=None,
     return applicant_id
 
 def create_loan_application(applicant_id, loan_type, loan_amount, loan_purpose, 
-                           loan_term, application_data=None):
-    """Create a new loan application"""
+                           loan_term, application_data=None, idempotency_key=None, dedup_hash=None):
+    """Create a new loan application
+
+    Raises DuplicateApplicationError if idempotency_key is already taken.
+    """
     session = get_session()
     loan_application = LoanApplication(
         applicant_id=applicant_id,
@@ -61,14 +107,49 @@ def create_loan_application(applicant_id, loan_type, loan_amount, loan_purpose,
         loan_term=loan_term,
         current_state="APPLICATION_SUBMITTED",
         state_history={"APPLICATION_SUBMITTED": {"timestamp": str(datetime.datetime.utcnow())}},
-        application_data=application_data or {}
+        application_data=application_data or {},
+        idempotency_key=idempotency_key,
+        dedup_hash=dedup_hash
     )
     session.add(loan_application)
-    session.commit()
+    record_loan_created(session, loan_application.current_state)
+    try:
+        session.commit()
+    except IntegrityError:
+        # A concurrent submission with the same key won the race
+        session.rollback()
+        existing = None
+        if idempotency_key:
+            existing = session.query(LoanApplication.id).filter_by(idempotency_key=idempotency_key).first()
+        session.close()
+        if existing:
+            raise DuplicateApplicationError(existing.id)
+        raise
     loan_id = loan_application.id
     session.close()
     return loan_id
 
+def find_duplicate_application(idempotency_key=None, dedup_hash=None, window_hours=24):
+    """Return the id of an earlier loan with the same key or fingerprint, or None
+
+    A matching idempotency key always counts; a matching fingerprint only
+    within window_hours. Both lookups are served by indexes.
+    """
+    if not idempotency_key and not dedup_hash:
+        return None
+    criteria = []
+    if idempotency_key:
+        criteria.append(LoanApplication.idempotency_key == idempotency_key)
+    if dedup_hash:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=window_hours)
+        criteria.append(and_(LoanApplication.dedup_hash == dedup_hash, LoanApplication.created_at >= cutoff))
+    session = get_session()
+    try:
+        existing = session.query(LoanApplication.id).filter(or_(*criteria)).order_by(LoanApplication.id).first()
+        return existing.id if existing else None
+    finally:
+        session.close()
+
 def update_loan_application_state(loan_application_id, new_state):
     """Update the state of a loan application"""
     session = get_session()
@@ -77,32 +158,139 @@ def update_loan_application_state(loan_application_id, new_state):
         old_state = loan.current_state
         loan.current_state = new_state
         
-        # Update state history
-        state_history = loan.state_history or {}
-        state_history[new_state] = {"timestamp": str(datetime.datetime.utcnow()), "from": old_state}
+        # Update state history (copied so the JSON column registers the change)
+        now = datetime.datetime.utcnow()
+        state_history = dict(loan.state_history or {})
+        entered_at = parse_history_timestamp(state_history.get(old_state, {}).get("timestamp"))
+        state_history[new_state] = {"timestamp": str(now), "from": old_state}
         loan.state_history = state_history
         
+        record_transition(session, old_state, new_state, entered_at=entered_at, now=now)
+        
+        # Announce the transition in the same commit (transactional outbox)
+        applicant = loan.applicant
+        enqueue_event(session, "STATE_CHANGED", loan.id, {
+            "from_state": old_state,
+            "to_state": new_state,
+            "timestamp": str(now),
+            "applicant_name": applicant.name if applicant else None,
+            "loan_type": loan.loan_type,
+            "loan_amount": loan.loan_amount,
+            "tenant_id": (loan.application_data or {}).get("tenant_id")
+        })
         session.commit()
         session.close()
+        invalidate_loan(loan_application_id)
         return True
     session.close()
     return False
 
 def log_agent_interaction(loan_application_id, agent_name, interaction_type, 
-                         input_data, output_data, notes=None):
-    """Log an agent interaction"""
+                         input_data, output_data, notes=None, token_usage=None, is_error=None,
+                         processed_event=None):
+    """Log an agent interaction, with the LLM token usage it incurred
+
+    is_error defaults to whether output_data reports status "error".
+    loan_application_id may be None for a request rejected before a loan
+    was created, so its tokens and outcome are still counted.
+
+    processed_event, an (idempotency_key, handler) pair, marks an outbox
+    event as handled in the same transaction. Returns False without logging
+    if that event was already marked, True otherwise.
+    """
+    token_usage = token_usage or {}
+    if is_error is None:
+        is_error = is_error_output(output_data)
     session = get_session()
+    try:
+        if processed_event and not record_processed(session, *processed_event):
+            return False
+        _add_interaction(
+            session, loan_application_id, agent_name, interaction_type,
+            input_data, output_data, notes, token_usage, is_error
+        )
+        session.commit()
+    finally:
+        session.close()
+    if loan_application_id:
+        invalidate_loan(loan_application_id)
+    return True
+
+def _add_interaction(session, loan_application_id, agent_name, interaction_type,
+                     input_data, output_data, notes, token_usage, is_error):
     interaction = AgentInteraction(
         loan_application_id=loan_application_id,
         agent_name=agent_name,
         interaction_type=interaction_type,
-        input_data=input_data,
-        output_data=output_data,
-        notes=notes
+        input_hash=store_payload(session, input_data),
+        output_hash=store_payload(session, output_data),
+        overall_assessment=output_data.get("overall_assessment") if isinstance(output_data, dict) else None,
+        is_error=is_error,
+        notes=notes,
+        llm_model=token_usage.get("model"),
+        prompt_tokens=token_usage.get("prompt_tokens", 0),
+        completion_tokens=token_usage.get("completion_tokens", 0),
+        cached_tokens=token_usage.get("cached_tokens", 0)
     )
     session.add(interaction)
-    session.commit()
-    session.close()
+    
+    if loan_application_id and interaction_type == "APPLICATION_VALIDATION":
+        # Keep the latest-validation pointer in the same transaction
+        session.flush()
+        session.query(LoanApplication).filter_by(id=loan_application_id).update(
+            {"latest_validation_id": interaction.id}
+        )
+    
+    record_interaction(session, agent_name, interaction_type, is_error, token_usage)
+
+def store_payload(session, payload):
+    """Store a payload once per distinct content and return its hash"""
+    if payload is None:
+        return None
+    content_hash, encoding, data, raw_size = encode_payload(payload)
+    if session.get(InteractionPayload, content_hash) is None:
+        try:
+            with session.begin_nested():
+                session.add(InteractionPayload(
+                    content_hash=content_hash, encoding=encoding, data=data, raw_size=raw_size
+                ))
+        except IntegrityError:
+            pass  # stored concurrently by another writer
+    return content_hash
+
+def is_event_processed(idempotency_key, handler):
+    """Return True if handler has already committed its work for an outbox event"""
+    session = get_session()
+    try:
+        return is_processed(session, idempotency_key, handler)
+    finally:
+        session.close()
+
+def get_operations_metrics():
+    """Aggregated pipeline metrics for the operations view"""
+    session = get_session()
+    try:
+        return get_pipeline_metrics(session)
+    finally:
+        session.close()
+
+def get_token_usage(loan_application_id):
+    """Total LLM token usage recorded for a loan application"""
+    session = get_session()
+    try:
+        prompt_tokens, completion_tokens, cached_tokens = session.query(
+            func.coalesce(func.sum(AgentInteraction.prompt_tokens), 0),
+            func.coalesce(func.sum(AgentInteraction.completion_tokens), 0),
+            func.coalesce(func.sum(AgentInteraction.cached_tokens), 0)
+        ).filter_by(loan_application_id=loan_application_id).one()
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    finally:
+        session.close()
 
 def get_documents(loan_application_id):
     """Retrieve documents for a specific loan application"""
@@ -116,10 +304,14 @@ def get_documents(loan_application_id):
         session.close()
 
 def get_loan_application(loan_application_id):
-    """Retrieve a loan application by ID"""
+    """Retrieve a loan application by ID, falling back to the archive"""
     session = get_session()
     try:
         loan_application = session.query(LoanApplication).get(loan_application_id)
+        if loan_application is None:
+            record = load_archived_loan(session, loan_application_id)
+            if record:
+                return archived_loan_to_orm(record)
         return loan_application
     finally:
         session.close()
@@ -128,11 +320,37 @@ def get_validation_result(loan_application_id):
     """Retrieve validation assessment from agent interactions"""
     session = get_session()
     try:
-        interaction = session.query(AgentInteraction).filter_by(
-            loan_application_id=loan_application_id,
-            interaction_type="APPLICATION_VALIDATION"
-        ).order_by(AgentInteraction.created_at.desc()).first()
-        
-        return interaction.output_data.get('overall_assessment') if interaction else None
+        interaction = get_latest_validation(session, loan_application_id)
+        if interaction is None:
+            record = load_archived_loan(session, loan_application_id)
+            interaction = latest_archived_validation(record) if record else None
+        return get_overall_assessment(interaction)
     finally:
         session.close()
+
+def get_overall_assessment(interaction):
+    """Read overall_assessment from its column, decoding legacy rows if needed"""
+    if interaction is None:
+        return None
+    if interaction.overall_assessment is not None or interaction.output_hash:
+        return interaction.overall_assessment
+    output_data = interaction.output_data
+    return output_data.get('overall_assessment') if isinstance(output_data, dict) else None
+
+def get_latest_validation(session, loan_application_id, loan=None, load_output=False):
+    """Return the latest APPLICATION_VALIDATION interaction for a loan
+
+    Uses the denormalized pointer (two primary-key reads); rows written
+    before the pointer existed fall back to scanning the loan's interactions.
+    With load_output the output payload is loaded in the same query.
+    """
+    loan = loan or session.get(LoanApplication, loan_application_id)
+    if loan is None:
+        return None
+    options = [joinedload(AgentInteraction.output_payload)] if load_output else []
+    if loan.latest_validation_id:
+        return session.get(AgentInteraction, loan.latest_validation_id, options=options)
+    return session.query(AgentInteraction).options(*options).filter_by(
+        loan_application_id=loan.id,
+        interaction_type="APPLICATION_VALIDATION"
+    ).order_by(AgentInteraction.created_at.desc()).first()
@@ -0,0 +1,28 @@
+import hashlib
+import re
+
+def _submission_parts(application_data):
+    email = str(application_data.get("applicant_email") or "").strip().lower()
+    ssn_digits = re.sub(r"\D", "", str(application_data.get("ssn") or ""))
+    try:
+        amount = f"{float(application_data.get('loan_amount') or 0):.2f}"
+    except (TypeError, ValueError):
+        amount = ""
+    loan_type = str(application_data.get("loan_type") or "").strip().lower()
+    return [email, ssn_digits[-4:], amount, loan_type]
+
+def normalize_submission(application_data):
+    """Canonical identity of a submission: email, SSN last 4, amount and loan type"""
+    return "|".join(_submission_parts(application_data))
+
+def submission_fingerprint(application_data):
+    """SHA-256 of the normalized submission, stored as LoanApplication.dedup_hash
+
+    Returns None unless both the email and the SSN last 4 are present, since
+    amount and loan type alone would match unrelated applicants.
+    """
+    parts = _submission_parts(application_data)
+    email, ssn_last4 = parts[0], parts[1]
+    if not email or len(ssn_last4) != 4:
+        return None
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
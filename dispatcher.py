@@ -0,0 +1,147 @@
+import threading
+import time
+from config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_PURGE_INTERVAL
+from db_utils import init_db, get_session
+from outbox import claim_events, mark_dispatched, mark_failed, purge_events
+from protocol import A2AProtocol
+from scheduler import get_scheduler, BATCH
+from application_agent import ApplicationIntakeAgent
+from document_agent import DocumentVerificationAgent
+
+# Handoffs triggered by entering a state: the task to create, the capability
+# of the agent it comes from and of the agent that should handle it.
+STATE_ROUTES = {
+    "INITIAL_VALIDATION": {
+        "task_type": "DOCUMENT_VERIFICATION_NEEDED",
+        "sender_capability": "validate_application_form",
+        "recipient_capability": "verify_identity_documents"
+    }
+}
+
+def build_protocol():
+    """Create a protocol with the agents the dispatcher routes to"""
+    protocol = A2AProtocol(scheduler=get_scheduler())
+    protocol.register_agent(ApplicationIntakeAgent())
+    protocol.register_agent(DocumentVerificationAgent())
+    return protocol
+
+class OutboxDispatcher:
+    """Poll the outbox in batches and deliver events to agents via A2AProtocol"""
+
+    def __init__(self, protocol=None, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL,
+                 purge_interval=OUTBOX_PURGE_INTERVAL):
+        self.protocol = protocol or build_protocol()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._stop = threading.Event()
+
+    def dispatch_batch(self):
+        """Claim and deliver one batch; returns the number of events handled"""
+        session = get_session()
+        try:
+            events = claim_events(session, self.batch_size)
+            for event in events:
+                try:
+                    self._route(event)
+                    mark_dispatched(session, event)
+                except Exception as e:
+                    print(f"Error dispatching outbox event {event.id}: {e}")
+                    mark_failed(session, event, e)
+                session.commit()
+            return len(events)
+        finally:
+            session.close()
+
+    def _route(self, event):
+        if event.event_type != "STATE_CHANGED":
+            return
+        route = STATE_ROUTES.get((event.payload or {}).get("to_state"))
+        if not route:
+            return
+
+        sender = self.protocol.get_agent_by_capability(route["sender_capability"])
+        recipient = self.protocol.get_agent_by_capability(route["recipient_capability"])
+        if not sender or not recipient:
+            raise RuntimeError(f"No agent registered for route {route}")
+
+        task_id = self.protocol.create_task(
+            task_type=route["task_type"],
+            data={"loan_application_id": event.loan_application_id},
+            initiator_agent_id=sender.agent_id
+        )
+        self.protocol.assign_task(task_id, recipient.agent_id)
+        response = self.protocol.send_message(
+            sender_agent_id=sender.agent_id,
+            recipient_agent_id=recipient.agent_id,
+            task_id=task_id,
+            content={
+                "message_type": route["task_type"],
+                "loan_application_id": event.loan_application_id,
+                "applicant_name": event.payload.get("applicant_name"),
+                "loan_type": event.payload.get("loan_type"),
+                "loan_amount": event.payload.get("loan_amount"),
+                "idempotency_key": event.idempotency_key
+            },
+            capability=route["recipient_capability"],
+            tenant_id=event.payload.get("tenant_id"),
+            priority=BATCH
+        )
+        if response is False:
+            raise RuntimeError(f"Delivery of task {task_id} was rejected")
+        content = response.get("content") if isinstance(response, dict) else None
+        if isinstance(content, dict) and content.get("status") == "error":
+            raise RuntimeError(content.get("message", "Agent reported an error"))
+        self.protocol.complete_task(task_id, response)
+
+    def purge(self):
+        """Apply the outbox retention period"""
+        session = get_session()
+        try:
+            events, markers = purge_events(session)
+            if events or markers:
+                print(f"Purged {events} outbox events and {markers} processed markers")
+        finally:
+            session.close()
+
+    def run_forever(self):
+        """Dispatch until stop() is called, sleeping only when the outbox is idle"""
+        last_purge = None
+        while not self._stop.is_set():
+            try:
+                if last_purge is None or time.monotonic() - last_purge >= self.purge_interval:
+                    last_purge = time.monotonic()
+                    self.purge()
+                handled = self.dispatch_batch()
+            except Exception as e:
+                print(f"Error in outbox dispatcher: {e}")
+                handled = 0
+            if handled < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        """Ask run_forever to return after the current batch"""
+        self._stop.set()
+
+_background_dispatcher = None
+_background_lock = threading.Lock()
+
+def start_background_dispatcher():
+    """Start one dispatcher thread per process (safe to call on every rerun)"""
+    global _background_dispatcher
+    with _background_lock:
+        if _background_dispatcher is None:
+            _background_dispatcher = OutboxDispatcher()
+            threading.Thread(
+                target=_background_dispatcher.run_forever, name="outbox-dispatcher", daemon=True
+            ).start()
+        return _background_dispatcher
+
+if __name__ == "__main__":
+    init_db()
+    dispatcher = OutboxDispatcher()
+    print("Outbox dispatcher running")
+    try:
+        dispatcher.run_forever()
+    except KeyboardInterrupt:
+        dispatcher.stop()
@@ -0,0 +1,67 @@
+import hashlib
+import sqlite3
+import threading
+from payloads import canonical_json
+
+# Completions are keyed by everything that determines them: model, messages,
+# sampling parameters and tool options. Changing a prompt or MODEL_NAME
+# therefore misses the cache, while re-running unchanged inputs is free.
+
+class ResponseCache:
+    """Disk-backed cache of chat completion responses in a SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, model TEXT, response TEXT)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def key(model, messages, temperature, max_tokens, **options):
+        """Hash of the request parameters that determine a completion"""
+        request = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "options": options
+        }
+        return hashlib.sha256(canonical_json(request)).hexdigest()
+
+    def get(self, key):
+        """Return the stored response JSON for key, or None"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, model, response_json):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response) VALUES (?, ?, ?)",
+                (key, model, response_json)
+            )
+            self._connection.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None
+            }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_TIMEOUT,
+    LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_POOL_SIZE
+)
+
+class CircuitOpenError(Exception):
+    """Raised when a model's circuit breaker is rejecting calls"""
+    pass
+
+class CircuitBreaker:
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, name, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may be attempted right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: let a single probe through
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failure_count = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Let another probe through after a call that failed for a reason unrelated to the model's health"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """Count a failed call and open the circuit if the threshold is reached"""
+        with self._lock:
+            self.failure_count += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name):
+    """Get the circuit breaker for a model, creating it on first use"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+_hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_POOL_SIZE, thread_name_prefix="llm-hedge")
+# One slot per pool worker, so a request is only submitted when it can start at once
+_hedge_slots = threading.BoundedSemaphore(LLM_HEDGE_POOL_SIZE)
+
+def _submit_to_slot(fn, started):
+    """Run fn on the hedge pool; the caller must already hold a slot"""
+    def run():
+        started.set()
+        try:
+            return fn()
+        finally:
+            _hedge_slots.release()
+    return _hedge_executor.submit(run)
+
+def hedged_call(fn, hedge_delay, allow_hedge=None):
+    """Call fn, sending a duplicate request if the first runs longer than hedge_delay
+
+    Returns a tuple of (result, hedged). The first successful result wins; an
+    exception is only raised once every in-flight request has failed.
+
+    The delay is measured from when the first request starts running. When
+    the pool has no free worker the call runs unhedged on the caller's
+    thread, and no duplicate is sent unless a worker is free and
+    allow_hedge() (e.g. a rate limiter's try_acquire) returns True.
+    """
+    if not hedge_delay or not _hedge_slots.acquire(blocking=False):
+        return fn(), False
+
+    started = threading.Event()
+    futures = [_submit_to_slot(fn, started)]
+    started.wait()
+    done, _ = wait(futures, timeout=hedge_delay)
+    if not done and _hedge_slots.acquire(blocking=False):
+        if allow_hedge is None or allow_hedge():
+            futures.append(_submit_to_slot(fn, threading.Event()))
+        else:
+            _hedge_slots.release()
+
+    last_error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is None:
+                for other in pending:
+                    other.cancel()
+                return future.result(), len(futures) > 1
+            last_error = error
+    raise last_error
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a request may be sent"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Take tokens from the bucket, sleeping until enough have accumulated"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def try_acquire(self, tokens=1):
+        """Take tokens only if they are available now; never blocks"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+class LLMCallStats:
+    """Thread-safe record of LLM call outcomes and latencies per model"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._outcomes = defaultdict(lambda: defaultdict(int))
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._hedge_latencies = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, model, outcome, latency=None, attempts=1, hedged=False, hedge_sample=False):
+        """Record the outcome of a single logical LLM call
+
+        hedge_sample marks a latency that hedge_delay should learn from:
+        a non-streamed call that succeeded on its first attempt.
+        """
+        with self._lock:
+            counts = self._outcomes[model]
+            counts[outcome] += 1
+            counts["attempts"] += attempts
+            if hedged:
+                counts["hedged"] += 1
+            if latency is not None:
+                self._latencies[model].append(latency)
+                if hedge_sample:
+                    self._hedge_latencies[model].append(latency)
+
+    def hedge_delay(self, model, percentile=LLM_HEDGE_PERCENTILE, min_samples=LLM_HEDGE_MIN_SAMPLES):
+        """Latency percentile after which to hedge, or None until enough calls are timed"""
+        with self._lock:
+            return self._hedge_delay(model, percentile, min_samples)
+
+    def _hedge_delay(self, model, percentile=LLM_HEDGE_PERCENTILE, min_samples=LLM_HEDGE_MIN_SAMPLES):
+        latencies = sorted(self._hedge_latencies.get(model, ()))
+        if len(latencies) < min_samples:
+            return None
+        return _percentile(latencies, percentile)
+
+    def snapshot(self):
+        """Return outcome counts and latency percentiles per model"""
+        with self._lock:
+            stats = {}
+            for model, counts in self._outcomes.items():
+                latencies = sorted(self._latencies[model])
+                stats[model] = {
+                    "outcomes": dict(counts),
+                    "latency_p50": _percentile(latencies, 0.50),
+                    "latency_p95": _percentile(latencies, 0.95),
+                    "latency_p99": _percentile(latencies, 0.99),
+                    "hedge_delay": self._hedge_delay(model),
+                    "circuit_state": get_circuit_breaker(model).state
+                }
+            return stats
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+llm_call_stats = LLMCallStats()
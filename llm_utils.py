@@ -1,50 +1,353 @@
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, RateLimitError, InternalServerError
+import httpx
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion
 import json
+import time
+import contextvars
+from contextlib import contextmanager
 import streamlit as st
-from config import MODEL_NAME
+from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from config import (
+    MODEL_NAME, FALLBACK_MODEL_NAME, LLM_TIMEOUT, LLM_MAX_RETRIES
+)
+from llm_resilience import CircuitOpenError, get_circuit_breaker, hedged_call, llm_call_stats
+from stream_parser import IncrementalJSONParser
+from pydantic import ValidationError
+from structured_output import (
+    resolve_output_model, build_tool, tool_choice, parse_structured, describe_errors
+)
 
-# Set OpenAI API key
-client = OpenAI(api_key=st.secrets['OPENAI_API_KEY'])
+# Set OpenAI API key; retries are handled by the resilience layer below
+client = OpenAI(api_key=st.secrets['OPENAI_API_KEY'], timeout=LLM_TIMEOUT, max_retries=0)
 
-def generate_llm_response(prompt, system_message=None, temperature=0.7, max_tokens=1000):
-    """Generate a response from the LLM"""
+# Errors worth retrying; anything else (bad request, auth) fails fast
+TRANSIENT_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+# Errors that say the model is unhealthy and count toward its circuit breaker.
+# Timeouts on connect are APIConnectionError; a stream that stalls while being
+# read raises httpx's own timeout. A bad or unauthorized request does not count.
+BREAKER_ERRORS = TRANSIENT_ERRORS + (httpx.TimeoutException,)
+
+_token_usage = contextvars.ContextVar("llm_token_usage", default=None)
+
+# Optional process-wide hooks, off by default; batch jobs such as replay.py
+# install a ResponseCache and a TokenBucket through configure_llm
+_response_cache = None
+_rate_limiter = None
+
+def configure_llm(response_cache=None, rate_limiter=None):
+    """Install (or, with None, remove) the response cache and request rate limiter"""
+    global _response_cache, _rate_limiter
+    _response_cache = response_cache
+    _rate_limiter = rate_limiter
+
+@contextmanager
+def track_token_usage():
+    """Accumulate token usage of every LLM call made inside the block"""
+    usage = {"model": None, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    token = _token_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _token_usage.reset(token)
+
+def _record_usage(model, usage):
+    tracked = _token_usage.get()
+    if tracked is None or usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    tracked["model"] = model
+    tracked["calls"] += 1
+    tracked["prompt_tokens"] += usage.prompt_tokens or 0
+    tracked["completion_tokens"] += usage.completion_tokens or 0
+    tracked["cached_tokens"] += (getattr(details, "cached_tokens", None) or 0)
+
+def _estimate_usage(messages, text, options):
+    """Approximate usage (about 4 characters per token) of a stream closed before its usage chunk"""
+    prompt_chars = len(json.dumps(messages)) + len(json.dumps(options.get("tools") or []))
+    prompt_tokens = prompt_chars // 4
+    completion_tokens = len(text) // 4
+    return CompletionUsage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens
+    )
+
+def _call_model(model, messages, temperature, max_tokens, **options):
+    """Call a single model with jittered retries and hedging"""
+    cache = _response_cache
+    if cache:
+        cache_key = cache.key(model, messages, temperature, max_tokens, **options)
+        cached = cache.get(cache_key)
+        if cached:
+            llm_call_stats.record(model, "cache_hit", attempts=0)
+            return ChatCompletion.model_validate_json(cached)
+
+    breaker = get_circuit_breaker(model)
+    if not breaker.allow_request():
+        llm_call_stats.record(model, "circuit_open", attempts=0)
+        raise CircuitOpenError(f"Circuit open for model {model}")
+
+    def request():
+        return client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **options
+        )
+
+    started = time.monotonic()
+    attempts = 0
+    hedged = False
+    try:
+        for attempt in Retrying(
+            retry=retry_if_exception_type(TRANSIENT_ERRORS),
+            wait=wait_random_exponential(multiplier=0.5, max=10),
+            stop=stop_after_attempt(LLM_MAX_RETRIES + 1),
+            reraise=True
+        ):
+            with attempt:
+                attempts += 1
+                limiter = _rate_limiter
+                if limiter:
+                    limiter.acquire()
+                # A duplicate request is only sent if it fits in the rate limit right now
+                response, attempt_hedged = hedged_call(
+                    request,
+                    llm_call_stats.hedge_delay(model),
+                    allow_hedge=limiter.try_acquire if limiter else None
+                )
+                hedged = hedged or attempt_hedged
+    except Exception as e:
+        if isinstance(e, BREAKER_ERRORS):
+            breaker.record_failure()
+        else:
+            breaker.release_probe()
+        llm_call_stats.record(model, "failure", time.monotonic() - started, attempts, hedged)
+        raise
+
+    breaker.record_success()
+    outcome = "success" if attempts == 1 else "retried_success"
+    llm_call_stats.record(model, outcome, time.monotonic() - started, attempts, hedged, hedge_sample=attempts == 1)
+    _record_usage(model, response.usage)
+    if cache:
+        cache.set(cache_key, model, response.model_dump_json())
+    return response
+
+def _stream_model(model, messages, temperature, max_tokens, on_text, **options):
+    """Stream a single model, passing each text delta to on_text
+
+    Retries only cover opening the stream; hedging is not used because the
+    first chunk already arrives early. Returns (text, stopped) where stopped
+    is True if on_text asked to end the stream before it finished. A stopped
+    stream never delivers its usage chunk, so its usage is estimated.
+    """
+    breaker = get_circuit_breaker(model)
+    if not breaker.allow_request():
+        llm_call_stats.record(model, "circuit_open", attempts=0)
+        raise CircuitOpenError(f"Circuit open for model {model}")
+
+    started = time.monotonic()
+    attempts = 0
+    parts = []
+    stopped = False
+    usage_recorded = False
+    try:
+        for attempt in Retrying(
+            retry=retry_if_exception_type(TRANSIENT_ERRORS),
+            wait=wait_random_exponential(multiplier=0.5, max=10),
+            stop=stop_after_attempt(LLM_MAX_RETRIES + 1),
+            reraise=True
+        ):
+            with attempt:
+                attempts += 1
+                if _rate_limiter:
+                    _rate_limiter.acquire()
+                stream = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **options
+                )
+        with stream:
+            for chunk in stream:
+                if chunk.usage:
+                    _record_usage(model, chunk.usage)
+                    usage_recorded = True
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.tool_calls:
+                    text = delta.tool_calls[0].function.arguments or ""
+                else:
+                    text = delta.content or ""
+                if not text:
+                    continue
+                parts.append(text)
+                if on_text and on_text(text):
+                    stopped = True
+                    break
+        if not usage_recorded:
+            _record_usage(model, _estimate_usage(messages, "".join(parts), options))
+    except Exception as e:
+        if isinstance(e, BREAKER_ERRORS):
+            breaker.record_failure()
+        else:
+            breaker.release_probe()
+        llm_call_stats.record(model, "failure", time.monotonic() - started, attempts)
+        raise
+
+    breaker.record_success()
+    outcome = "success" if attempts == 1 else "retried_success"
+    llm_call_stats.record(model, outcome, time.monotonic() - started, attempts)
+    return "".join(parts), stopped
+
+def _build_messages(prompt, system_message=None):
     messages = []
     
     if system_message:
         messages.append({"role": "system", "content": system_message})
     
     messages.append({"role": "user", "content": prompt})
+    return messages
+
+def _complete(messages, temperature, max_tokens, **options):
+    """Return the first successful completion message, falling back across models"""
+    models = [MODEL_NAME]
+    if FALLBACK_MODEL_NAME and FALLBACK_MODEL_NAME != MODEL_NAME:
+        models.append(FALLBACK_MODEL_NAME)
+    
+    for index, model in enumerate(models):
+        try:
+            response = _call_model(model, messages, temperature, max_tokens, **options)
+            if index > 0:
+                llm_call_stats.record(model, "fallback_used", attempts=0)
+            return response.choices[0].message
+        except Exception as e:
+            print(f"Error in LLM call to {model}: {e}")
+    
+    return None
+
+def _complete_stream(messages, temperature, max_tokens, make_on_text, **options):
+    """Streaming counterpart of _complete; returns (text, stopped) or None
+
+    make_on_text is called once per model attempt so a fallback model starts
+    from a fresh handler instead of one fed by a half-finished stream.
+    """
+    models = [MODEL_NAME]
+    if FALLBACK_MODEL_NAME and FALLBACK_MODEL_NAME != MODEL_NAME:
+        models.append(FALLBACK_MODEL_NAME)
+    
+    for index, model in enumerate(models):
+        try:
+            result = _stream_model(model, messages, temperature, max_tokens, make_on_text(), **options)
+            if index > 0:
+                llm_call_stats.record(model, "fallback_used", attempts=0)
+            return result
+        except Exception as e:
+            print(f"Error in streaming LLM call to {model}: {e}")
+    
+    return None
+
+def generate_llm_response(prompt, system_message=None, temperature=0.7, max_tokens=1000,
+                          stream=False, on_chunk=None):
+    """Generate a response from the LLM, falling back to a cheaper model on failure
+
+    With stream=True each text delta is passed to on_chunk as it arrives;
+    on_chunk may return True to stop reading, in which case the text
+    received so far is returned.
+    """
+    messages = _build_messages(prompt, system_message)
+    if stream:
+        result = _complete_stream(messages, temperature, max_tokens, lambda: on_chunk)
+        return result[0] if result else None
     
+    message = _complete(messages, temperature, max_tokens)
+    return message.content if message else None
+
+def _tool_arguments(message):
+    """Return the raw JSON produced by a forced tool call (or plain content)"""
+    if message.tool_calls:
+        return message.tool_calls[0].function.arguments
+    return message.content or ""
+
+def _reask(raw_output, error, model):
+    """Ask for a corrected object using only the invalid output and its errors"""
+    messages = [
+        {"role": "system", "content": f"Correct the arguments of the {model.__name__} call so they satisfy its schema. Keep every valid value unchanged."},
+        {"role": "user", "content": f"Invalid arguments:\n{raw_output}\n\nErrors:\n{describe_errors(error)}"}
+    ]
+    message = _complete(
+        messages, temperature=0, max_tokens=600,
+        tools=[build_tool(model)], tool_choice=tool_choice(model)
+    )
+    if not message:
+        return None
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error in LLM call: {e}")
+        return parse_structured(_tool_arguments(message), model)
+    except ValidationError as e:
+        print(f"Structured output still invalid after re-ask: {e}")
         return None
 
-def process_structured_output(prompt, system_message, output_structure, temperature=0.2):
-    """Generate structured output from LLM"""
-    system_prompt = f"{system_message}\n\nPlease respond with a JSON object following this structure: {json.dumps(output_structure, indent=2)}"
+def process_structured_output(prompt, system_message, output_structure, temperature=0.2, max_tokens=1000,
+                              stream=False, on_field=None):
+    """Generate structured output from LLM
+
+    output_structure is a pydantic model (or a legacy example dict, converted
+    to a cached model). The schema is enforced through a forced tool call;
+    malformed output is repaired locally and, failing that, corrected with a
+    short re-ask instead of repeating the whole prompt.
+
+    With stream=True, top-level fields are parsed as the response streams in
+    and passed to on_field(name, value). If on_field returns True the stream
+    is abandoned and the fields received so far are returned unvalidated.
+    """
+    model = resolve_output_model(output_structure)
+    system_prompt = f"{system_message}\n\nRespond by calling the {model.__name__} function."
+    messages = _build_messages(prompt, system_prompt)
+    tool_options = {"tools": [build_tool(model)], "tool_choice": tool_choice(model)}
     
-    try:
-        response = generate_llm_response(prompt, system_prompt, temperature)
-        # Extract JSON from response
-        try:
-            json_start = response.find('{')
-            json_end = response.rfind('}')
-            if json_start >= 0 and json_end >= 0:
-                json_str = response[json_start:json_end+1]
-                return json.loads(json_str)
-            else:
-                return json.loads(response)
-        except json.JSONDecodeError:
-            print("Failed to parse JSON from LLM response")
+    if stream:
+        parser = None
+        
+        def make_on_text():
+            nonlocal parser
+            parser = IncrementalJSONParser()
+            
+            def on_text(text):
+                stop = False
+                for name, value in parser.feed(text).items():
+                    if on_field and on_field(name, value):
+                        stop = True
+                return stop
+            
+            return on_text
+        
+        result = _complete_stream(messages, temperature, max_tokens, make_on_text, **tool_options)
+        if not result:
             return None
-    except Exception as e:
-        print(f"Error in structured LLM call: {e}")
-        return None
+        raw_output, stopped = result
+        if stopped:
+            return dict(parser.fields)
+    else:
+        message = _complete(messages, temperature, max_tokens, **tool_options)
+        if not message:
+            return None
+        raw_output = _tool_arguments(message)
+    
+    try:
+        result = parse_structured(raw_output, model)
+    except ValidationError as e:
+        print(f"Structured output failed validation, re-asking: {e.error_count()} errors")
+        result = _reask(raw_output, e, model)
+    
+    return result.model_dump() if result else None
+
+def get_llm_stats():
+    """Return recorded LLM call outcomes and latency percentiles per model"""
+    return llm_call_stats.snapshot()
@@ -0,0 +1,192 @@
+import datetime
+import json
+import sys
+from collections import defaultdict
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+from models import (
+    LoanApplication, AgentInteraction, PipelineStateCount, StageDwellStat, AgentOutcomeStat
+)
+from schemas import LLM_ERROR_MESSAGE
+
+# Writers take the caller's session so aggregates commit atomically with the
+# row that changed them; readers only touch the small aggregate tables.
+
+def _increment(session, model, key, **deltas):
+    """Add deltas to an aggregate row, creating it on first use"""
+    values = {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items()}
+    if session.query(model).filter_by(**key).update(values, synchronize_session=False):
+        return
+    try:
+        with session.begin_nested():
+            session.add(model(**key, **deltas))
+    except IntegrityError:
+        # Another writer created the row first
+        session.query(model).filter_by(**key).update(values, synchronize_session=False)
+
+def record_loan_created(session, state):
+    """Count a new loan entering the pipeline"""
+    _increment(session, PipelineStateCount, {"state": state}, loan_count=1)
+
+def record_loans_archived(session, loan_count):
+    """Remove archived COMPLETED loans from the live queue depth"""
+    _increment(session, PipelineStateCount, {"state": "COMPLETED"}, loan_count=-loan_count)
+
+def record_transition(session, old_state, new_state, entered_at=None, now=None):
+    """Move a loan between state counts and record the dwell time of old_state"""
+    if old_state:
+        _increment(session, PipelineStateCount, {"state": old_state}, loan_count=-1)
+    _increment(session, PipelineStateCount, {"state": new_state}, loan_count=1)
+
+    if old_state and entered_at:
+        dwell = max(0.0, ((now or datetime.datetime.utcnow()) - entered_at).total_seconds())
+        _increment(session, StageDwellStat, {"state": old_state}, exits=1, total_seconds=dwell)
+        session.query(StageDwellStat).filter_by(state=old_state).update(
+            {StageDwellStat.max_seconds: case(
+                (StageDwellStat.max_seconds < dwell, dwell), else_=StageDwellStat.max_seconds
+            )},
+            synchronize_session=False
+        )
+
+def record_interaction(session, agent_name, interaction_type, is_error, token_usage=None):
+    """Count an agent interaction and whether it failed"""
+    token_usage = token_usage or {}
+    _increment(
+        session, AgentOutcomeStat,
+        {"agent_name": agent_name, "interaction_type": interaction_type},
+        total=1,
+        errors=1 if is_error else 0,
+        prompt_tokens=token_usage.get("prompt_tokens", 0),
+        completion_tokens=token_usage.get("completion_tokens", 0)
+    )
+
+def parse_history_timestamp(value):
+    """Parse a state_history timestamp written with str(datetime)"""
+    try:
+        return datetime.datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def get_pipeline_metrics(session):
+    """Return queue depth, dwell times and agent error rates from the aggregates"""
+    queue_depth = {row.state: row.loan_count for row in session.query(PipelineStateCount).all()}
+
+    dwell_times = {
+        row.state: {
+            "exits": row.exits,
+            "avg_seconds": row.total_seconds / row.exits if row.exits else None,
+            "max_seconds": row.max_seconds
+        }
+        for row in session.query(StageDwellStat).all()
+    }
+
+    agents = [
+        {
+            "agent_name": row.agent_name,
+            "interaction_type": row.interaction_type,
+            "total": row.total,
+            "errors": row.errors,
+            "error_rate": row.errors / row.total if row.total else None,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens
+        }
+        for row in session.query(AgentOutcomeStat).order_by(
+            AgentOutcomeStat.agent_name, AgentOutcomeStat.interaction_type
+        ).all()
+    ]
+
+    return {
+        "queue_depth": queue_depth,
+        "dwell_times": dwell_times,
+        "agents": agents,
+        "generated_at": datetime.datetime.utcnow().isoformat()
+    }
+
+def _add_dwell(dwell, state_history):
+    # Each history entry records when a state was entered and where from
+    for details in state_history.values():
+        previous = state_history.get(details.get("from") or "")
+        entered_at = parse_history_timestamp(previous.get("timestamp")) if previous else None
+        left_at = parse_history_timestamp(details.get("timestamp"))
+        if entered_at and left_at:
+            seconds = max(0.0, (left_at - entered_at).total_seconds())
+            stat = dwell[details["from"]]
+            stat["exits"] += 1
+            stat["total_seconds"] += seconds
+            stat["max_seconds"] = max(stat["max_seconds"], seconds)
+
+def _add_outcome(outcomes, agent_name, interaction_type, is_error, output_data, prompt_tokens, completion_tokens):
+    if is_error is None:
+        # Legacy rows predate the is_error column
+        is_error = is_error_output(output_data)
+    stat = outcomes[(agent_name, interaction_type)]
+    stat["total"] += 1
+    stat["errors"] += 1 if is_error else 0
+    stat["prompt_tokens"] += prompt_tokens or 0
+    stat["completion_tokens"] += completion_tokens or 0
+
+def rebuild_pipeline_metrics(session):
+    """Recompute every aggregate from the base tables (one-off backfill)
+
+    Queue depth counts live loans only, as archiving removes loans from it.
+    Dwell times and agent outcomes also include archived loans, read back
+    from the Parquet parts listed in the archive manifest.
+    """
+    # Imported here: archive records its deletions through this module
+    from archive import iter_archived_rows
+
+    queue_depth = defaultdict(int)
+    dwell = defaultdict(lambda: {"exits": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+    outcomes = defaultdict(lambda: {"total": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0})
+
+    query = session.query(LoanApplication.current_state, LoanApplication.state_history)
+    for current_state, state_history in query.yield_per(1000):
+        queue_depth[current_state] += 1
+        _add_dwell(dwell, state_history or {})
+    for row in iter_archived_rows(session, "loans", ["state_history"]):
+        _add_dwell(dwell, json.loads(row["state_history"]) if row["state_history"] else {})
+
+    outcome_columns = [
+        "agent_name", "interaction_type", "is_error", "output_data", "prompt_tokens", "completion_tokens"
+    ]
+    query = session.query(*(getattr(AgentInteraction, column) for column in outcome_columns))
+    for row in query.yield_per(1000):
+        _add_outcome(outcomes, *row)
+    for row in iter_archived_rows(session, "interactions", outcome_columns):
+        if row["is_error"] is None and row["output_data"]:
+            # Archived output_data is JSON text
+            row["output_data"] = json.loads(row["output_data"])
+        _add_outcome(outcomes, *(row[column] for column in outcome_columns))
+
+    for model in (PipelineStateCount, StageDwellStat, AgentOutcomeStat):
+        session.query(model).delete()
+    session.add_all(PipelineStateCount(state=state, loan_count=count) for state, count in queue_depth.items())
+    session.add_all(StageDwellStat(state=state, **stat) for state, stat in dwell.items())
+    session.add_all(
+        AgentOutcomeStat(agent_name=agent_name, interaction_type=interaction_type, **stat)
+        for (agent_name, interaction_type), stat in outcomes.items()
+    )
+    session.commit()
+
+def is_error_output(output_data):
+    """Infer whether an interaction failed from its logged output
+
+    Covers agent results with status "error" and the validation fallback
+    returned when the LLM call failed.
+    """
+    return isinstance(output_data, dict) and (
+        output_data.get("status") == "error"
+        or output_data.get("overall_assessment") == LLM_ERROR_MESSAGE
+    )
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python metrics.py rebuild")
+    from db_utils import init_db, get_session
+    init_db()
+    session = get_session()
+    try:
+        rebuild_pipeline_metrics(session)
+    finally:
+        session.close()
+    print("Pipeline metrics rebuilt")
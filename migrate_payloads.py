@@ -0,0 +1,69 @@
+import argparse
+import json
+from sqlalchemy import null, or_, text
+from db_utils import init_db, get_session, engine, store_payload
+from metrics import is_error_output
+from models import AgentInteraction
+from payloads import storage_report
+
+def migrate_interaction_payloads(batch_size=500):
+    """Move inline input_data/output_data into deduplicated payload rows
+
+    Runs in id-ordered batches, each committed on its own, so it can be
+    interrupted and resumed. Returns the number of interactions migrated.
+    """
+    init_db()
+    migrated = 0
+    last_id = 0
+    while True:
+        session = get_session()
+        try:
+            interactions = session.query(AgentInteraction).filter(
+                AgentInteraction.id > last_id,
+                AgentInteraction.input_hash.is_(None),
+                AgentInteraction.output_hash.is_(None),
+                or_(AgentInteraction.input_data.isnot(None), AgentInteraction.output_data.isnot(None))
+            ).order_by(AgentInteraction.id).limit(batch_size).all()
+            if not interactions:
+                return migrated
+
+            for interaction in interactions:
+                input_data, output_data = interaction.input_data, interaction.output_data
+                interaction.input_hash = store_payload(session, input_data)
+                interaction.output_hash = store_payload(session, output_data)
+                if isinstance(output_data, dict):
+                    interaction.overall_assessment = output_data.get("overall_assessment")
+                if interaction.is_error is None:
+                    interaction.is_error = is_error_output(output_data)
+                interaction.input_data = null()
+                interaction.output_data = null()
+
+            session.commit()
+            migrated += len(interactions)
+            last_id = interactions[-1].id
+            print(f"Migrated {migrated} interactions")
+        finally:
+            session.close()
+
+def vacuum():
+    """Reclaim the space freed by the migration (SQLite only)"""
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interaction payload storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="move inline payloads into interaction_payloads")
+    migrate_parser.add_argument("--batch-size", type=int, default=500)
+    migrate_parser.add_argument("--vacuum", action="store_true", help="run VACUUM afterwards")
+    report_parser = subparsers.add_parser("report", help="bytes saved on a synthetic dataset")
+    report_parser.add_argument("--loans", type=int, default=10000)
+    report_parser.add_argument("--steps", type=int, default=3, help="logged interactions per loan")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(f"Done: {migrate_interaction_payloads(args.batch_size)} interactions migrated")
+        if args.vacuum:
+            vacuum()
+    else:
+        print(json.dumps(storage_report(args.loans, args.steps), indent=2))
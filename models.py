@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, Boolean, ForeignKey
+from sqlalchemy import (
+    Column, Integer, String, Float, DateTime, Text, JSON, Boolean, ForeignKey, PrimaryKeyConstraint, LargeBinary,
+    Index
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
+from payloads import decode_payload
 
 Base = declarative_base()
 
@@ -25,6 +29,10 @@ class Applicant(Base):
 
 class LoanApplication(Base):
     __tablename__ = "loan_applications"
+    __table_args__ = (
+        Index("ix_loan_applications_idempotency_key", "idempotency_key", unique=True),
+        Index("ix_loan_applications_dedup_hash_created_at", "dedup_hash", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True)
     applicant_id = Column(Integer, ForeignKey("applicants.id"))
@@ -36,6 +44,9 @@ class LoanApplication(Base):
     current_state = Column(String(50))
     state_history = Column(JSON)
     application_data = Column(JSON)  # Additional application fields
+    latest_validation_id = Column(Integer)  # Denormalized id of the latest APPLICATION_VALIDATION interaction
+    idempotency_key = Column(String(64))  # client-supplied key, one loan per key
+    dedup_hash = Column(String(64))  # fingerprint of email, SSN last 4, amount and type
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
@@ -57,6 +68,19 @@ class Document(Base):
     
     loan_application = relationship("LoanApplication", back_populates="documents")
 
+class InteractionPayload(Base):
+    __tablename__ = "interaction_payloads"
+    
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the canonical JSON
+    encoding = Column(String(10), nullable=False)  # json or zlib; zstd only on rows from older writers
+    data = Column(LargeBinary, nullable=False)
+    raw_size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    def load(self):
+        """Decode the stored payload"""
+        return decode_payload(self.encoding, self.data)
+
 class AgentInteraction(Base):
     __tablename__ = "agent_interactions"
     
@@ -64,9 +88,94 @@ class AgentInteraction(Base):
     loan_application_id = Column(Integer, ForeignKey("loan_applications.id"))
     agent_name = Column(String(100))
     interaction_type = Column(String(50))
-    input_data = Column(JSON)
-    output_data = Column(JSON)
+    input_data = Column(JSON)  # legacy inline payload; new rows use input_hash
+    output_data = Column(JSON)  # legacy inline payload; new rows use output_hash
+    input_hash = Column(String(64), ForeignKey("interaction_payloads.content_hash"))
+    output_hash = Column(String(64), ForeignKey("interaction_payloads.content_hash"))
+    overall_assessment = Column(Text)  # hot field copied out of the output payload
+    is_error = Column(Boolean)
     notes = Column(Text)
+    llm_model = Column(String(50))
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     loan_application = relationship("LoanApplication", back_populates="agent_interactions")
+    input_payload = relationship("InteractionPayload", foreign_keys=[input_hash])
+    output_payload = relationship("InteractionPayload", foreign_keys=[output_hash])
+    
+    def get_input_data(self):
+        """Input payload, whether stored by hash or inline (legacy rows)"""
+        return self.input_payload.load() if self.input_hash else self.input_data
+    
+    def get_output_data(self):
+        """Output payload, whether stored by hash or inline (legacy rows)"""
+        return self.output_payload.load() if self.output_hash else self.output_data
+
+class OutboxEvent(Base):
+    """Event written in the same transaction as the change it announces"""
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    loan_application_id = Column(Integer, index=True)
+    payload = Column(JSON)
+    idempotency_key = Column(String(64), unique=True, nullable=False)
+    status = Column(String(20), default="PENDING", index=True)  # PENDING, IN_FLIGHT, DISPATCHED, FAILED
+    attempts = Column(Integer, default=0)
+    available_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    claim_token = Column(String(32), index=True)
+    claimed_until = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    dispatched_at = Column(DateTime)
+
+class ProcessedEvent(Base):
+    """Consumer-side record of handled events, for idempotent redelivery"""
+    __tablename__ = "processed_events"
+    __table_args__ = (PrimaryKeyConstraint("idempotency_key", "handler"),)
+    
+    idempotency_key = Column(String(64))
+    handler = Column(String(100))
+    processed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ArchivedLoan(Base):
+    """Manifest index of loans moved to the Parquet archive"""
+    __tablename__ = "archived_loans"
+    
+    loan_application_id = Column(Integer, primary_key=True)
+    applicant_id = Column(Integer, index=True)
+    partition = Column(String(50))  # e.g. completed_month=2025-01
+    part_name = Column(String(100))  # file name shared by the loans/documents/interactions parts
+    completed_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# Aggregates maintained incrementally by metrics.py in the same transaction
+# as each state transition and agent interaction.
+
+class PipelineStateCount(Base):
+    __tablename__ = "pipeline_state_counts"
+    
+    state = Column(String(50), primary_key=True)
+    loan_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class StageDwellStat(Base):
+    __tablename__ = "stage_dwell_stats"
+    
+    state = Column(String(50), primary_key=True)
+    exits = Column(Integer, default=0, nullable=False)
+    total_seconds = Column(Float, default=0.0, nullable=False)
+    max_seconds = Column(Float, default=0.0, nullable=False)
+
+class AgentOutcomeStat(Base):
+    __tablename__ = "agent_outcome_stats"
+    __table_args__ = (PrimaryKeyConstraint("agent_name", "interaction_type"),)
+    
+    agent_name = Column(String(100))
+    interaction_type = Column(String(50))
+    total = Column(Integer, default=0, nullable=False)
+    errors = Column(Integer, default=0, nullable=False)
+    prompt_tokens = Column(Integer, default=0, nullable=False)
+    completion_tokens = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,36 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import OPS_API_HOST, OPS_API_PORT
+from db_utils import init_db, get_operations_metrics
+
+class OpsMetricsHandler(BaseHTTPRequestHandler):
+    """Serve the aggregated pipeline metrics as JSON"""
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics/pipeline":
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._send_json(200, get_operations_metrics())
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def run(host=OPS_API_HOST, port=OPS_API_PORT):
+    """Run the operations metrics endpoint until interrupted"""
+    init_db()
+    server = ThreadingHTTPServer((host, port), OpsMetricsHandler)
+    print(f"Serving pipeline metrics on http://{host}:{port}/metrics/pipeline")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,119 @@
+import datetime
+import uuid
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from config import OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETENTION_DAYS
+from models import OutboxEvent, ProcessedEvent
+
+# Producers call enqueue_event with the session that holds their change, so
+# the event commits or rolls back with it. Dispatchers claim events under a
+# lease; an event whose lease expires is claimed again (at-least-once), and
+# consumers use record_processed, in the same transaction as their side
+# effect, to ignore redeliveries. Dispatched events and processed markers
+# are purged after OUTBOX_RETENTION_DAYS; FAILED events are kept until their
+# loan is archived.
+
+def enqueue_event(session, event_type, loan_application_id, payload):
+    """Add an event to the outbox as part of the caller's transaction"""
+    event = OutboxEvent(
+        event_type=event_type,
+        loan_application_id=loan_application_id,
+        payload=payload,
+        idempotency_key=uuid.uuid4().hex,
+        status="PENDING",
+        attempts=0,
+        available_at=datetime.datetime.utcnow()
+    )
+    session.add(event)
+    return event
+
+def claim_events(session, batch_size, lease_seconds=OUTBOX_LEASE_SECONDS):
+    """Claim up to batch_size due events for this dispatcher and return them"""
+    now = datetime.datetime.utcnow()
+    claim_token = uuid.uuid4().hex
+    due_ids = session.query(OutboxEvent.id).filter(or_(
+        and_(OutboxEvent.status == "PENDING", OutboxEvent.available_at <= now),
+        and_(OutboxEvent.status == "IN_FLIGHT", OutboxEvent.claimed_until < now)
+    )).order_by(OutboxEvent.id).limit(batch_size).scalar_subquery()
+    # The status re-check makes the claim safe against a concurrent dispatcher
+    session.query(OutboxEvent).filter(
+        OutboxEvent.id.in_(due_ids),
+        or_(
+            OutboxEvent.status == "PENDING",
+            and_(OutboxEvent.status == "IN_FLIGHT", OutboxEvent.claimed_until < now)
+        )
+    ).update({
+        OutboxEvent.status: "IN_FLIGHT",
+        OutboxEvent.claim_token: claim_token,
+        OutboxEvent.claimed_until: now + datetime.timedelta(seconds=lease_seconds),
+        OutboxEvent.attempts: OutboxEvent.attempts + 1
+    }, synchronize_session=False)
+    session.commit()
+    return session.query(OutboxEvent).filter_by(claim_token=claim_token).order_by(OutboxEvent.id).all()
+
+def mark_dispatched(session, event):
+    """Record successful delivery of a claimed event"""
+    event.status = "DISPATCHED"
+    event.dispatched_at = datetime.datetime.utcnow()
+    event.claimed_until = None
+    event.last_error = None
+
+def mark_failed(session, event, error, max_attempts=OUTBOX_MAX_ATTEMPTS):
+    """Schedule a retry with exponential backoff, or park the event as FAILED"""
+    event.last_error = str(error)[:2000]
+    event.claimed_until = None
+    if event.attempts >= max_attempts:
+        event.status = "FAILED"
+        return
+    event.status = "PENDING"
+    event.available_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=min(300, 2 ** event.attempts))
+
+def is_processed(session, idempotency_key, handler):
+    """Return True if a handler has already committed its work for an event"""
+    return session.get(ProcessedEvent, (idempotency_key, handler)) is not None
+
+def record_processed(session, idempotency_key, handler):
+    """Mark an event handled in the caller's transaction; False on redelivery
+
+    Call it before the handler's other writes and commit them together. If
+    a concurrent delivery got there first, the caller's session is rolled
+    back. A plain flush is used rather than a savepoint, which pysqlite
+    would commit on its own when it opens the transaction.
+    """
+    if is_processed(session, idempotency_key, handler):
+        return False
+    session.add(ProcessedEvent(idempotency_key=idempotency_key, handler=handler))
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        return False
+    return True
+
+def purge_events(session, retention_days=OUTBOX_RETENTION_DAYS):
+    """Delete dispatched events and processed markers past the retention period
+
+    Returns (events, markers) deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    events = session.query(OutboxEvent).filter(
+        OutboxEvent.status == "DISPATCHED",
+        OutboxEvent.dispatched_at < cutoff
+    ).delete(synchronize_session=False)
+    markers = session.query(ProcessedEvent).filter(
+        ProcessedEvent.processed_at < cutoff
+    ).delete(synchronize_session=False)
+    session.commit()
+    return events, markers
+
+def delete_loan_events(session, loan_application_ids):
+    """Delete every event of the given loans and its processed markers (caller commits)"""
+    keys = session.query(OutboxEvent.idempotency_key).filter(
+        OutboxEvent.loan_application_id.in_(loan_application_ids)
+    ).scalar_subquery()
+    session.query(ProcessedEvent).filter(
+        ProcessedEvent.idempotency_key.in_(keys)
+    ).delete(synchronize_session=False)
+    session.query(OutboxEvent).filter(
+        OutboxEvent.loan_application_id.in_(loan_application_ids)
+    ).delete(synchronize_session=False)
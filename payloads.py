@@ -0,0 +1,120 @@
+import hashlib
+import json
+import random
+import zlib
+from config import PAYLOAD_COMPRESSION_THRESHOLD
+
+try:
+    import zstandard
+except ImportError:  # only needed to read zstd payloads written by older versions
+    zstandard = None
+
+# Interaction payloads are stored once per distinct content (keyed by the
+# SHA-256 of their canonical JSON) and compressed when large enough to gain.
+# New payloads always use zlib, so any process can read them whether or not
+# the optional zstandard package is installed.
+
+def canonical_json(payload):
+    """Serialize a payload deterministically so equal content hashes equally"""
+    return json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8")
+
+def encode_payload(payload):
+    """Return (content_hash, encoding, data, raw_size) for a JSON payload"""
+    raw = canonical_json(payload)
+    content_hash = hashlib.sha256(raw).hexdigest()
+    encoding, data = "json", raw
+    if len(raw) >= PAYLOAD_COMPRESSION_THRESHOLD:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            encoding, data = "zlib", compressed
+    return content_hash, encoding, data, len(raw)
+
+def decode_payload(encoding, data):
+    """Inverse of encode_payload"""
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-encoded payloads")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif encoding == "zlib":
+        data = zlib.decompress(data)
+    elif encoding != "json":
+        raise ValueError(f"Unknown payload encoding: {encoding}")
+    return json.loads(data)
+
+def _synthetic_application(rng, index):
+    purposes = ["Home renovation", "Debt consolidation", "New car purchase", "Tuition", "Working capital"]
+    return {
+        "applicant_name": f"Applicant {index}",
+        "applicant_email": f"applicant{index}@example.com",
+        "applicant_phone": f"+1-555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        "applicant_address": f"{rng.randint(1, 9999)} Main St, Anytown, USA",
+        "date_of_birth": f"19{rng.randint(50, 99)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+        "ssn": f"{rng.randint(0, 9999):04d}",
+        "employment_status": rng.choice(["Employed", "Self-Employed", "Retired"]),
+        "employer": rng.choice(["Acme Corporation", "Globex", "Initech", "Umbrella"]),
+        "annual_income": rng.randrange(30000, 250000, 500),
+        "monthly_debt": rng.randrange(0, 5000, 50),
+        "credit_score": rng.randint(550, 850),
+        "loan_type": rng.choice(["Personal", "Mortgage", "Auto", "Student", "Business"]),
+        "loan_amount": rng.randrange(1000, 500000, 1000),
+        "loan_purpose": rng.choice(purposes),
+        "loan_term": rng.choice([12, 24, 36, 60, 120, 360])
+    }
+
+def _synthetic_validation(rng):
+    valid = rng.random() > 0.2
+    return {
+        "is_valid": valid,
+        "completeness_check": {"is_complete": True, "missing_fields": []},
+        "eligibility_check": {
+            "is_eligible": valid,
+            "reasons": [] if valid else ["Debt-to-income ratio exceeds guideline for the requested amount"]
+        },
+        "consistency_check": {"is_consistent": True, "inconsistencies": []},
+        "overall_assessment": (
+            "The application is complete and the applicant meets basic eligibility criteria."
+            if valid else
+            "The application is complete but the applicant does not meet eligibility criteria."
+        )
+    }
+
+def storage_report(loans=1000, steps_per_loan=3, seed=0):
+    """Compare legacy JSON-column storage with deduplicated, compressed payloads
+
+    Each synthetic loan logs steps_per_loan interactions the way the agents
+    do: one APPLICATION_VALIDATION with the application form as input and a
+    full validation result as output, then DOCUMENT_VERIFICATION_REQUESTs
+    whose input is only the loan id and whose output is a short status.
+    """
+    rng = random.Random(seed)
+    legacy_bytes = 0
+    reference_bytes = 0
+    payload_sizes = {}
+    interactions = 0
+    for index in range(loans):
+        steps = [(_synthetic_application(rng, index), _synthetic_validation(rng))] + [
+            ({"loan_application_id": index}, {"status": "pending", "message": "Document verification requested"})
+        ] * (steps_per_loan - 1)
+        for input_data, output_data in steps:
+            interactions += 1
+            for payload in (input_data, output_data):
+                legacy_bytes += len(json.dumps(payload).encode("utf-8"))
+                content_hash, _, data, _ = encode_payload(payload)
+                reference_bytes += len(content_hash)
+                payload_sizes.setdefault(content_hash, len(data))
+
+    payload_bytes = sum(payload_sizes.values())
+    new_bytes = payload_bytes + reference_bytes
+    return {
+        "loans": loans,
+        "interactions": interactions,
+        "distinct_payloads": len(payload_sizes),
+        "codec": "zlib",
+        "legacy_bytes": legacy_bytes,
+        "payload_bytes": payload_bytes,
+        "reference_bytes": reference_bytes,
+        "bytes_saved": legacy_bytes - new_bytes,
+        "ratio": legacy_bytes / new_bytes if new_bytes else None
+    }
@@ -0,0 +1,104 @@
+import datetime
+import json
+
+# Field handling for the application form when it is sent to the LLM:
+#   value    - sent as-is
+#   presence - only "provided" is sent; the content never reaches the prompt
+#   age      - a date of birth reduced to an age in whole years
+#   truncate - free text clipped to PROMPT_TEXT_LIMIT characters
+#   mask     - every digit but the last 4 replaced by X, keeping the format
+# Only contact details the checks cannot use are withheld; the rest keep
+# their (compacted) values so consistency checks and red flags still work.
+# Empty fields are omitted so the model reports them as missing.
+APPLICATION_PROMPT_FIELDS = [
+    ("applicant_name", "truncate"),
+    ("applicant_email", "truncate"),
+    ("applicant_phone", "presence"),
+    ("applicant_address", "presence"),
+    ("date_of_birth", "age"),
+    ("ssn", "mask"),
+    ("employment_status", "value"),
+    ("employer", "truncate"),
+    ("annual_income", "value"),
+    ("monthly_debt", "value"),
+    ("credit_score", "value"),
+    ("loan_type", "value"),
+    ("loan_amount", "value"),
+    ("loan_purpose", "truncate"),
+    ("loan_term", "value")
+]
+
+PROMPT_TEXT_LIMIT = 120
+
+# System prompts are fixed strings shared by every call; per-application
+# data only goes in the user turn.
+SYSTEM_PROMPTS = {
+    "application_validation": (
+        "You validate loan applications. Check: 1) completeness of required fields; "
+        "2) basic eligibility; 3) inconsistencies or red flags. "
+        "Fields shown as \"provided\" were filled in but withheld; absent fields are missing. "
+        "ssn digits other than the last 4 are masked as X. "
+        "age is in years, amounts in USD, loan_term in months."
+    ),
+    "document_verification": (
+        "You verify documents for loan applications and give a verification assessment."
+    )
+}
+
+def get_system_prompt(name):
+    """Return the canonical system prompt for a task"""
+    return SYSTEM_PROMPTS[name]
+
+def compact_application(application_data, today=None):
+    """Reduce an application form to the canonical fields the LLM needs"""
+    compact = {}
+    for field, mode in APPLICATION_PROMPT_FIELDS:
+        value = application_data.get(field)
+        if value is None or value == "":
+            continue
+        if mode == "presence":
+            compact[field] = "provided"
+        elif mode == "age":
+            age = _age_in_years(value, today or datetime.date.today())
+            if age is not None:
+                compact["age"] = age
+        elif mode == "mask":
+            compact[field] = _mask_digits(str(value).strip())
+        elif mode == "truncate":
+            text = " ".join(str(value).split())
+            compact[field] = text[:PROMPT_TEXT_LIMIT]
+        else:
+            compact[field] = value
+    return compact
+
+def serialize_compact(data):
+    """Serialize to canonical JSON with no insignificant whitespace"""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def build_validation_prompt(application_data):
+    """Build the user prompt for application validation"""
+    return "Application:" + serialize_compact(compact_application(application_data))
+
+def _mask_digits(text, keep=4):
+    digits = sum(char.isdigit() for char in text)
+    masked = []
+    for char in text:
+        if char.isdigit():
+            digits -= 1
+            masked.append(char if digits < keep else "X")
+        else:
+            masked.append(char)
+    return "".join(masked)
+
+def _age_in_years(date_of_birth, today):
+    if isinstance(date_of_birth, str):
+        try:
+            date_of_birth = datetime.datetime.strptime(date_of_birth[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    if isinstance(date_of_birth, datetime.datetime):
+        date_of_birth = date_of_birth.date()
+    if not isinstance(date_of_birth, datetime.date):
+        return None
+    had_birthday = (today.month, today.day) >= (date_of_birth.month, date_of_birth.day)
+    return today.year - date_of_birth.year - (0 if had_birthday else 1)
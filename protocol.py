@@ -1,11 +1,15 @@
 import json
 import uuid
+from concurrent.futures import Future
 from datetime import datetime
+from config import DEFAULT_TENANT
 
 class A2AProtocol:
-    def __init__(self):
+    def __init__(self, scheduler=None):
         self.agent_registry = {}
         self.task_registry = {}
+        # Optional FairScheduler; without one, agents run on the caller's thread
+        self.scheduler = scheduler
     
     def register_agent(self, agent):
         """Register an agent with the protocol"""
@@ -23,6 +27,30 @@ class A2AProtocol:
                 return agent_info["agent"]
         return None
     
+    def _execute(self, agent_id, capability, fn, tenant_id=None, priority="batch"):
+        """Run fn for an agent, through the scheduler when one is configured
+
+        capability is the one being invoked; the scheduler caps concurrency
+        per capability, so it must be one the agent advertises.
+        """
+        if capability not in self.agent_registry[agent_id]["card"]["capabilities"]:
+            raise ValueError(f"Agent {agent_id} does not have capability {capability!r}")
+        if not self.scheduler:
+            future = Future()
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.scheduler.submit(tenant_id or DEFAULT_TENANT, capability, fn, priority)
+    
+    def submit_agent(self, agent_id, capability, input_data, tenant_id=None, priority="batch", **kwargs):
+        """Queue agent.process(input_data) for capability and return a Future for its result"""
+        if agent_id not in self.agent_registry:
+            raise KeyError(f"Unknown agent: {agent_id}")
+        agent = self.agent_registry[agent_id]["agent"]
+        return self._execute(agent_id, capability, lambda: agent.process(input_data, **kwargs), tenant_id, priority)
+    
     def create_task(self, task_type, data, initiator_agent_id):
         """Create a new task in the system"""
         task_id = str(uuid.uuid4())
@@ -65,8 +93,9 @@ class A2AProtocol:
         task["updated_at"] = datetime.utcnow().isoformat()
         return True
     
-    def send_message(self, sender_agent_id, recipient_agent_id, task_id, content):
-        """Send a message from one agent to another"""
+    def send_message(self, sender_agent_id, recipient_agent_id, task_id, content, capability,
+                     tenant_id=None, priority="batch"):
+        """Send a message asking the recipient to perform capability"""
         if sender_agent_id not in self.agent_registry:
             return False
         
@@ -94,14 +123,17 @@ class A2AProtocol:
         sender_agent = self.agent_registry[sender_agent_id]["agent"]
         recipient_agent = self.agent_registry[recipient_agent_id]["agent"]
         
-        response_content = recipient_agent.receive_message({
+        incoming = {
             "task_id": task_id,
             "sender": sender_agent_id,
             "sender_name": sender_agent.name,
             "recipient": recipient_agent_id,
             "timestamp": datetime.utcnow().isoformat(),
             "content": content
-        })
+        }
+        response_content = self._execute(
+            recipient_agent_id, capability, lambda: recipient_agent.receive_message(incoming), tenant_id, priority
+        ).result()
         
         # Record the response
         response_message = {
@@ -0,0 +1,151 @@
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload, selectinload
+from cache import loan_view_cache
+from archive import load_archived_loan, archived_loan_to_orm, latest_archived_validation
+from db_utils import get_session, get_latest_validation, get_overall_assessment
+from models import LoanApplication, AgentInteraction
+
+# Read-side loaders returning plain dicts, so views never touch detached ORM
+# objects or trigger lazy loads after the session is closed.
+
+def get_loan_status(loan_application_id):
+    """Current state and validation assessment for a loan, taken from its cached view"""
+    view = get_loan_view(loan_application_id)
+    if view is None:
+        return None
+    return {
+        "loan_application_id": view["loan_application_id"],
+        "current_state": view["current_state"],
+        "validation_assessment": view["validation_assessment"]
+    }
+
+def get_loan_view(loan_application_id):
+    """Cached full loan view, invalidated by state changes and new interactions"""
+    loan_application_id = int(loan_application_id)
+    return loan_view_cache.get_or_load(loan_application_id, lambda: load_loan_view(loan_application_id))
+
+def load_loan_view(loan_application_id):
+    """Load a loan with applicant, documents, latest validation and history in two queries
+
+    Loans moved to the Parquet archive are read from there instead.
+    """
+    session = get_session()
+    try:
+        loan = session.query(LoanApplication).options(
+            joinedload(LoanApplication.applicant),
+            joinedload(LoanApplication.documents)
+        ).filter(LoanApplication.id == loan_application_id).first()
+        if not loan:
+            record = load_archived_loan(session, loan_application_id)
+            if not record:
+                return None
+            return _loan_view(archived_loan_to_orm(record), latest_archived_validation(record))
+        return _loan_view(loan, get_latest_validation(session, loan.id, loan=loan, load_output=True))
+    finally:
+        session.close()
+
+def load_loan_views(loan_application_ids, chunk_size=500):
+    """Load views for many loans, three queries per chunk of ids"""
+    views = {}
+    ids = list(loan_application_ids)
+    session = get_session()
+    try:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            loans = session.query(LoanApplication).options(
+                joinedload(LoanApplication.applicant),
+                selectinload(LoanApplication.documents)
+            ).filter(LoanApplication.id.in_(chunk)).all()
+            latest = _latest_validations(session, loans)
+            for loan in loans:
+                views[loan.id] = _loan_view(loan, latest.get(loan.id))
+        return views
+    finally:
+        session.close()
+
+def iter_loan_views(current_state=None, batch_size=500):
+    """Yield lists of loan views in id order, paging by key for large dashboards"""
+    last_id = 0
+    while True:
+        session = get_session()
+        try:
+            query = session.query(LoanApplication.id).filter(LoanApplication.id > last_id)
+            if current_state:
+                query = query.filter(LoanApplication.current_state == current_state)
+            ids = [row.id for row in query.order_by(LoanApplication.id).limit(batch_size)]
+        finally:
+            session.close()
+        if not ids:
+            return
+        views = load_loan_views(ids, chunk_size=batch_size)
+        yield [views[loan_id] for loan_id in ids if loan_id in views]
+        last_id = ids[-1]
+
+def _latest_validations(session, loans):
+    """Map loan id to its most recent APPLICATION_VALIDATION interaction"""
+    pointer_ids = [loan.latest_validation_id for loan in loans if loan.latest_validation_id]
+    legacy_ids = [loan.id for loan in loans if not loan.latest_validation_id]
+    
+    criteria = []
+    if pointer_ids:
+        criteria.append(AgentInteraction.id.in_(pointer_ids))
+    if legacy_ids:
+        # Loans written before the pointer existed
+        criteria.append(AgentInteraction.id.in_(
+            session.query(func.max(AgentInteraction.id)).filter(
+                AgentInteraction.loan_application_id.in_(legacy_ids),
+                AgentInteraction.interaction_type == "APPLICATION_VALIDATION"
+            ).group_by(AgentInteraction.loan_application_id).scalar_subquery()
+        ))
+    if not criteria:
+        return {}
+    interactions = session.query(AgentInteraction).options(
+        joinedload(AgentInteraction.output_payload)
+    ).filter(or_(*criteria)).all()
+    return {interaction.loan_application_id: interaction for interaction in interactions}
+
+def _loan_view(loan, validation):
+    applicant = loan.applicant
+    validation_output = validation.get_output_data() if validation else None
+    return {
+        "loan_application_id": loan.id,
+        "current_state": loan.current_state,
+        "loan_type": loan.loan_type,
+        "loan_amount": loan.loan_amount,
+        "loan_purpose": loan.loan_purpose,
+        "loan_term": loan.loan_term,
+        "interest_rate": loan.interest_rate,
+        "created_at": loan.created_at,
+        "updated_at": loan.updated_at,
+        "applicant": {
+            "id": applicant.id,
+            "name": applicant.name,
+            "email": applicant.email,
+            "phone": applicant.phone,
+            "employment_status": applicant.employment_status,
+            "employer": applicant.employer,
+            "annual_income": applicant.annual_income
+        } if applicant else None,
+        "documents": [
+            {
+                "id": document.id,
+                "document_type": document.document_type,
+                "verification_status": document.verification_status,
+                "verification_notes": document.verification_notes,
+                "uploaded_at": document.uploaded_at,
+                "verified_at": document.verified_at
+            }
+            for document in loan.documents
+        ],
+        "latest_validation": validation_output,
+        "validation_assessment": get_overall_assessment(validation),
+        "state_history": _state_history(loan.state_history)
+    }
+
+def _state_history(state_history):
+    """Flatten the state_history JSON into a list ordered by timestamp"""
+    entries = [
+        {"state": state, "timestamp": details.get("timestamp"), "from": details.get("from")}
+        for state, details in (state_history or {}).items()
+    ]
+    return sorted(entries, key=lambda entry: entry["timestamp"] or "")
@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import joinedload
+from config import (
+    MODEL_NAME, REPLAY_WORKERS, REPLAY_CHUNK_SIZE, REPLAY_REQUESTS_PER_SECOND,
+    REPLAY_CACHE_PATH, REPLAY_REPORT_PATH
+)
+from application_agent import ApplicationIntakeAgent
+from db_utils import init_db, get_session
+from llm_cache import ResponseCache
+from llm_resilience import TokenBucket
+from llm_utils import configure_llm, track_token_usage
+from metrics import is_error_output
+from models import AgentInteraction
+
+# Historical APPLICATION_VALIDATION inputs are re-run through the current
+# _validate_application and the decisions compared with the stored output.
+# Interactions are read in id-ordered chunks and at most a few chunks are in
+# flight at once, so memory stays flat however many decisions are replayed.
+# Nothing is written back to the database.
+
+DECISION_FIELDS = [
+    ("is_valid",),
+    ("completeness_check", "is_complete"),
+    ("eligibility_check", "is_eligible"),
+    ("consistency_check", "is_consistent")
+]
+
+def iter_validation_chunks(session, chunk_size=REPLAY_CHUNK_SIZE, start_id=0, limit=None):
+    """Yield lists of (interaction_id, loan_application_id, input_data, output_data)"""
+    last_id = start_id
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        interactions = session.query(AgentInteraction).options(
+            joinedload(AgentInteraction.input_payload),
+            joinedload(AgentInteraction.output_payload)
+        ).filter(
+            AgentInteraction.interaction_type == "APPLICATION_VALIDATION",
+            AgentInteraction.id > last_id
+        ).order_by(AgentInteraction.id).limit(size).all()
+        if not interactions:
+            return
+        chunk = [
+            (interaction.id, interaction.loan_application_id,
+             interaction.get_input_data(), interaction.get_output_data())
+            for interaction in interactions
+        ]
+        session.expunge_all()
+        yield chunk
+        last_id = chunk[-1][0]
+        if remaining is not None:
+            remaining -= len(chunk)
+
+def _decision_value(output, path):
+    value = output
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def diff_decision(stored, replayed):
+    """Return {field: [stored, replayed]} for every decision flag that differs"""
+    changes = {}
+    for path in DECISION_FIELDS:
+        old, new = _decision_value(stored, path), _decision_value(replayed, path)
+        if old != new:
+            changes[".".join(path)] = [old, new]
+    return changes
+
+def _replay_one(agent, item):
+    interaction_id, loan_application_id, input_data, stored = item
+    with track_token_usage() as token_usage:
+        try:
+            replayed = agent._validate_application(input_data or {})
+        except Exception as e:
+            print(f"Error replaying interaction {interaction_id}: {e}")
+            replayed = None
+    return interaction_id, loan_application_id, stored, replayed, token_usage
+
+class ReplayReport:
+    """Running totals of a replay, serialized to the JSON report"""
+
+    def __init__(self):
+        self.started_at = datetime.datetime.utcnow()
+        self.replayed = 0
+        self.unchanged = 0
+        self.errors = []
+        self.previous_errors = 0
+        self.flips = {".".join(path): {"true_to_false": 0, "false_to_true": 0} for path in DECISION_FIELDS}
+        self.tokens = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self.changes = []
+
+    def add(self, interaction_id, loan_application_id, stored, replayed, token_usage):
+        self.replayed += 1
+        for name in self.tokens:
+            self.tokens[name] += token_usage[name]
+        if replayed is None or is_error_output(replayed):
+            self.errors.append(interaction_id)
+            return
+        if is_error_output(stored):
+            # Nothing to compare against; the old run never reached a decision
+            self.previous_errors += 1
+            return
+        changes = diff_decision(stored, replayed)
+        if not changes:
+            self.unchanged += 1
+            return
+        for field, (old, new) in changes.items():
+            if old is True and new is False:
+                self.flips[field]["true_to_false"] += 1
+            elif old is False and new is True:
+                self.flips[field]["false_to_true"] += 1
+        self.changes.append({
+            "interaction_id": interaction_id,
+            "loan_application_id": loan_application_id,
+            "changes": changes,
+            "stored_assessment": stored.get("overall_assessment"),
+            "replayed_assessment": replayed.get("overall_assessment")
+        })
+
+    def to_dict(self, cache=None):
+        return {
+            "started_at": self.started_at.isoformat(),
+            "elapsed_seconds": round((datetime.datetime.utcnow() - self.started_at).total_seconds(), 1),
+            "model": MODEL_NAME,
+            "replayed": self.replayed,
+            "unchanged": self.unchanged,
+            "changed": len(self.changes),
+            "errors": len(self.errors),
+            "previous_errors": self.previous_errors,
+            "flips": self.flips,
+            "tokens": self.tokens,
+            "cache": cache.stats() if cache else None,
+            "changes": self.changes,
+            "error_interaction_ids": self.errors
+        }
+
+def replay_decisions(limit=None, start_id=0, workers=REPLAY_WORKERS, chunk_size=REPLAY_CHUNK_SIZE,
+                     requests_per_second=REPLAY_REQUESTS_PER_SECOND, cache_path=REPLAY_CACHE_PATH):
+    """Replay stored validations through the current agent and return the report dict
+
+    LLM requests share a token bucket of requests_per_second, and responses
+    are cached in cache_path (None disables the cache) so unchanged prompts
+    cost nothing on the next run.
+    """
+    cache = ResponseCache(cache_path) if cache_path else None
+    configure_llm(
+        response_cache=cache,
+        rate_limiter=TokenBucket(requests_per_second) if requests_per_second else None
+    )
+    agent = ApplicationIntakeAgent()
+    report = ReplayReport()
+    session = get_session()
+    last_progress = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as executor:
+            pending = deque()
+            for chunk in iter_validation_chunks(session, chunk_size, start_id, limit):
+                for item in chunk:
+                    pending.append(executor.submit(_replay_one, agent, item))
+                # Keep the pool busy across chunk boundaries without reading ahead unboundedly
+                while len(pending) > 2 * max(workers, chunk_size):
+                    report.add(*pending.popleft().result())
+                if time.monotonic() - last_progress > 10:
+                    print(f"Replayed {report.replayed} decisions, {len(report.changes)} changed")
+                    last_progress = time.monotonic()
+            while pending:
+                report.add(*pending.popleft().result())
+    finally:
+        session.close()
+        configure_llm()
+        if cache:
+            cache.close()
+    return report.to_dict(cache)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay stored application validations against the current agent")
+    parser.add_argument("--limit", type=int, help="replay at most this many decisions")
+    parser.add_argument("--start-id", type=int, default=0, help="only interactions with a greater id")
+    parser.add_argument("--workers", type=int, default=REPLAY_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK_SIZE)
+    parser.add_argument("--rps", type=float, default=REPLAY_REQUESTS_PER_SECOND, help="LLM requests per second")
+    parser.add_argument("--cache", default=REPLAY_CACHE_PATH, help="response cache file")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default=REPLAY_REPORT_PATH)
+    args = parser.parse_args()
+
+    init_db()
+    result = replay_decisions(
+        limit=args.limit,
+        start_id=args.start_id,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        requests_per_second=args.rps,
+        cache_path=None if args.no_cache else args.cache
+    )
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f"Replayed {result['replayed']} decisions in {result['elapsed_seconds']}s: "
+          f"{result['changed']} changed, {result['errors']} errors; is_valid flips {result['flips']['is_valid']}")
+    print(f"Report written to {args.output}")
@@ -0,0 +1,228 @@
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import (
+    SCHEDULER_WORKERS, SCHEDULER_INTERACTIVE_RESERVED, TENANT_WEIGHTS, TENANT_MAX_CONCURRENCY,
+    DEFAULT_TENANT_MAX_CONCURRENCY, CAPABILITY_MAX_CONCURRENCY, INTERACTIVE_SLO_SECONDS
+)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+class _Job:
+    __slots__ = ("sequence", "tenant_id", "capability", "fn", "priority", "enqueued_at", "deadline", "future")
+
+    def __init__(self, sequence, tenant_id, capability, fn, priority, slo_seconds):
+        self.sequence = sequence
+        self.tenant_id = tenant_id
+        self.capability = capability
+        self.fn = fn
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + slo_seconds if slo_seconds else float("inf")
+        self.future = Future()
+
+class FairScheduler:
+    """Run agent work on a shared pool, fairly across tenants
+
+    Interactive jobs are started earliest-deadline-first ahead of batch work,
+    and SCHEDULER_INTERACTIVE_RESERVED workers are never given to batch jobs.
+    Batch jobs are shared between tenants by weighted deficit round robin.
+    Every job also respects its tenant's and its capability's concurrency cap.
+    """
+
+    def __init__(self, workers=SCHEDULER_WORKERS, interactive_reserved=SCHEDULER_INTERACTIVE_RESERVED,
+                 tenant_weights=None, tenant_max_concurrency=None, capability_max_concurrency=None,
+                 interactive_slo_seconds=INTERACTIVE_SLO_SECONDS, quantum=1.0):
+        self.workers = workers
+        self.interactive_reserved = min(interactive_reserved, workers - 1)
+        self.tenant_weights = TENANT_WEIGHTS if tenant_weights is None else tenant_weights
+        self.tenant_max_concurrency = TENANT_MAX_CONCURRENCY if tenant_max_concurrency is None else tenant_max_concurrency
+        self.capability_max_concurrency = (
+            CAPABILITY_MAX_CONCURRENCY if capability_max_concurrency is None else capability_max_concurrency
+        )
+        self.interactive_slo_seconds = interactive_slo_seconds
+        self.quantum = quantum
+
+        self._interactive = {}  # tenant -> deque of jobs
+        self._batch = {}  # tenant -> deque of jobs
+        self._round_robin = deque()  # tenants with queued batch jobs
+        self._deficit = {}
+        self._head_credited = False
+        self._running = 0
+        self._running_batch = 0
+        self._running_by_tenant = {}
+        self._running_by_capability = {}
+        self._sequence = itertools.count()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "slo_misses": 0, "wait_seconds": 0.0}
+
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-worker")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="agent-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, tenant_id, capability, fn, priority=BATCH):
+        """Queue fn() for a tenant and return a Future for its result"""
+        slo = self.interactive_slo_seconds if priority == INTERACTIVE else None
+        job = _Job(next(self._sequence), tenant_id, capability, fn, priority, slo)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            if priority == INTERACTIVE:
+                self._interactive.setdefault(tenant_id, deque()).append(job)
+            else:
+                queue = self._batch.setdefault(tenant_id, deque())
+                if not queue and tenant_id not in self._round_robin:
+                    self._round_robin.append(tenant_id)
+                queue.append(job)
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return job.future
+
+    def run(self, tenant_id, capability, fn, priority=BATCH):
+        """Submit fn() and wait for its result"""
+        return self.submit(tenant_id, capability, fn, priority).result()
+
+    def _can_run(self, job):
+        tenant_cap = self.tenant_max_concurrency.get(job.tenant_id, DEFAULT_TENANT_MAX_CONCURRENCY)
+        capability_cap = self.capability_max_concurrency.get(job.capability, self.workers)
+        return (
+            self._running_by_tenant.get(job.tenant_id, 0) < tenant_cap
+            and self._running_by_capability.get(job.capability, 0) < capability_cap
+        )
+
+    def _next_interactive_job(self):
+        """Earliest-deadline-first among runnable interactive queue heads"""
+        best = None
+        for queue in self._interactive.values():
+            if queue and self._can_run(queue[0]):
+                if best is None or (queue[0].deadline, queue[0].sequence) < (best.deadline, best.sequence):
+                    best = queue[0]
+        if best:
+            self._interactive[best.tenant_id].popleft()
+        return best
+
+    def _next_batch_job(self):
+        """Weighted deficit round robin over tenants with queued batch work"""
+        if self._running_batch >= self.workers - self.interactive_reserved:
+            return None
+        turns = 0
+        while self._round_robin and turns <= len(self._round_robin):
+            tenant_id = self._round_robin[0]
+            queue = self._batch.get(tenant_id)
+            if not queue:
+                self._round_robin.popleft()
+                self._deficit.pop(tenant_id, None)
+                self._head_credited = False
+                continue
+            weight = self.tenant_weights.get(tenant_id, 1)
+            if not self._head_credited:
+                # Credit once per turn; bound the carry-over of a blocked tenant
+                credit = self._deficit.get(tenant_id, 0.0) + self.quantum * weight
+                self._deficit[tenant_id] = min(credit, 2 * max(1.0, self.quantum * weight))
+                self._head_credited = True
+            if self._deficit[tenant_id] >= 1 and self._can_run(queue[0]):
+                self._deficit[tenant_id] -= 1
+                return queue.popleft()
+            self._round_robin.rotate(-1)
+            self._head_credited = False
+            turns += 1
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                job = None
+                while not self._shutdown:
+                    if self._running < self.workers:
+                        job = self._next_interactive_job() or self._next_batch_job()
+                    if job:
+                        break
+                    self._condition.wait()
+                if job is None:
+                    return
+                self._start(job)
+
+    def _start(self, job):
+        waited = time.monotonic() - job.enqueued_at
+        self._running += 1
+        if job.priority != INTERACTIVE:
+            self._running_batch += 1
+        self._running_by_tenant[job.tenant_id] = self._running_by_tenant.get(job.tenant_id, 0) + 1
+        self._running_by_capability[job.capability] = self._running_by_capability.get(job.capability, 0) + 1
+        self._stats["wait_seconds"] += waited
+        if time.monotonic() > job.deadline:
+            self._stats["slo_misses"] += 1
+        self._executor.submit(self._execute, job)
+
+    def _execute(self, job):
+        if not job.future.set_running_or_notify_cancel():
+            self._finish(job, failed=False)
+            return
+        try:
+            result = job.fn()
+        except BaseException as e:
+            job.future.set_exception(e)
+            self._finish(job, failed=True)
+        else:
+            job.future.set_result(result)
+            self._finish(job, failed=False)
+
+    def _finish(self, job, failed):
+        with self._condition:
+            self._running -= 1
+            if job.priority != INTERACTIVE:
+                self._running_batch -= 1
+            self._running_by_tenant[job.tenant_id] -= 1
+            self._running_by_capability[job.capability] -= 1
+            self._stats["failed" if failed else "completed"] += 1
+            self._condition.notify()
+
+    def stats(self):
+        """Queue depths, running counts and SLO metrics"""
+        with self._condition:
+            started = self._stats["completed"] + self._stats["failed"] + self._running
+            return {
+                "queued": {
+                    tenant_id: {
+                        INTERACTIVE: len(self._interactive.get(tenant_id, ())),
+                        BATCH: len(self._batch.get(tenant_id, ()))
+                    }
+                    for tenant_id in set(self._interactive) | set(self._batch)
+                },
+                "running": self._running,
+                "running_by_tenant": dict(self._running_by_tenant),
+                "running_by_capability": dict(self._running_by_capability),
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "interactive_slo_misses": self._stats["slo_misses"],
+                "avg_wait_seconds": self._stats["wait_seconds"] / started if started else None
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; queued jobs that have not started are cancelled"""
+        with self._condition:
+            self._shutdown = True
+            pending = [job for queues in (self._interactive, self._batch) for queue in queues.values() for job in queue]
+            for queues in (self._interactive, self._batch):
+                queues.clear()
+            self._round_robin.clear()
+            self._condition.notify_all()
+        for job in pending:
+            job.future.cancel()
+        self._executor.shutdown(wait=wait)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Process-wide scheduler shared by the UI and the outbox dispatcher"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler()
+        return _scheduler
@@ -0,0 +1,36 @@
+from typing import List, Literal
+from pydantic import BaseModel, Field
+
+# Booleans and statuses are required so a truncated or malformed response is
+# never silently read as a decision; free-text fields fall back to defaults.
+
+# Reason given in every check of the fallback validation used when the LLM
+# call fails, so logged outputs can be told apart from real rejections
+LLM_ERROR_MESSAGE = "Error processing application"
+
+class CompletenessCheck(BaseModel):
+    is_complete: bool
+    missing_fields: List[str] = Field(default_factory=list)
+
+class EligibilityCheck(BaseModel):
+    is_eligible: bool
+    reasons: List[str] = Field(default_factory=list)
+
+class ConsistencyCheck(BaseModel):
+    is_consistent: bool
+    inconsistencies: List[str] = Field(default_factory=list)
+
+class ApplicationValidation(BaseModel):
+    """Structured assessment of a loan application form"""
+    is_valid: bool
+    completeness_check: CompletenessCheck
+    eligibility_check: EligibilityCheck
+    consistency_check: ConsistencyCheck
+    overall_assessment: str = ""
+
+class DocumentVerification(BaseModel):
+    """Structured verification assessment of a single document"""
+    verification_status: Literal["VERIFIED", "NEEDS_REVIEW", "REJECTED"]
+    confidence_score: float = Field(0.0, ge=0.0, le=1.0)
+    verification_notes: str = ""
+    detected_issues: List[str] = Field(default_factory=list)
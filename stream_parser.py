@@ -0,0 +1,63 @@
+import json
+
+class IncrementalJSONParser:
+    """Parse a streamed JSON object, yielding top-level fields as they complete
+
+    Only the new characters of each chunk are scanned, so feeding a whole
+    response costs a single pass regardless of how it was chunked. Nested
+    objects and arrays are emitted once their closing bracket arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the fields it completed"""
+        completed = {}
+        self.buffer += chunk
+        buffer = self.buffer
+
+        for index in range(self._position, len(buffer)):
+            char = buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1 and char == "{":
+                    self._member_start = index + 1
+            elif char in "}]":
+                if self._depth == 1 and self._member_start is not None:
+                    self._complete_member(buffer[self._member_start:index], completed)
+                    self._member_start = None
+                self._depth = max(0, self._depth - 1)
+            elif char == "," and self._depth == 1 and self._member_start is not None:
+                self._complete_member(buffer[self._member_start:index], completed)
+                self._member_start = index + 1
+
+        self._position = len(buffer)
+        return completed
+
+    def _complete_member(self, text, completed):
+        text = text.strip()
+        if not text:
+            return
+        try:
+            member = json.loads("{" + text + "}")
+        except ValueError:
+            return
+        self.fields.update(member)
+        completed.update(member)
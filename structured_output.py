@@ -0,0 +1,146 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, List
+from pydantic import BaseModel, Field, ValidationError, create_model
+
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_DANGLING_KEY = re.compile(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$')
+
+# Keywords stripped from schema nodes, and keywords whose values are schemas
+_ANNOTATION_KEYWORDS = ("title", "description", "default")
+_SUBSCHEMA_KEYWORDS = ("items", "prefixItems", "additionalProperties", "anyOf", "allOf", "oneOf", "not")
+
+def resolve_output_model(output_structure):
+    """Return a pydantic model for a model class or a legacy example dict"""
+    if isinstance(output_structure, type) and issubclass(output_structure, BaseModel):
+        return output_structure
+    return _model_from_example_json(json.dumps(output_structure, sort_keys=True))
+
+@lru_cache(maxsize=64)
+def _model_from_example_json(example_json):
+    """Build (once per distinct example) a model whose fields mirror the example"""
+    return _model_from_example("StructuredOutput", json.loads(example_json))
+
+def _model_from_example(name, example):
+    fields = {}
+    for key, value in example.items():
+        if isinstance(value, dict):
+            nested_name = name + "".join(part.title() for part in key.split("_"))
+            fields[key] = (_model_from_example(nested_name, value), ...)
+        elif isinstance(value, bool):
+            fields[key] = (bool, ...)
+        elif isinstance(value, (int, float)):
+            fields[key] = (float, 0.0)
+        elif isinstance(value, list):
+            fields[key] = (List[Any], Field(default_factory=list))
+        else:
+            fields[key] = (str, "")
+    return create_model(name, **fields)
+
+@lru_cache(maxsize=64)
+def compact_schema(model):
+    """Return the model's JSON schema with refs inlined and titles stripped"""
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def compact(node):
+        # node is a schema (or a list of schemas); annotation keywords are
+        # dropped from schemas only, never from a properties mapping
+        if isinstance(node, list):
+            return [compact(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        if "$ref" in node:
+            return compact(definitions[node["$ref"].split("/")[-1]])
+        result = {}
+        for key, value in node.items():
+            if key in _ANNOTATION_KEYWORDS:
+                continue
+            if key in ("properties", "patternProperties"):
+                result[key] = {name: compact(subschema) for name, subschema in value.items()}
+            elif key in _SUBSCHEMA_KEYWORDS:
+                result[key] = compact(value)
+            else:
+                result[key] = value
+        return result
+
+    return compact(schema)
+
+@lru_cache(maxsize=64)
+def build_tool(model):
+    """Return the function-calling tool definition used to constrain output"""
+    function = {
+        "name": model.__name__,
+        "parameters": compact_schema(model)
+    }
+    if model.__doc__:
+        function["description"] = model.__doc__.strip()
+    return {"type": "function", "function": function}
+
+def tool_choice(model):
+    """Force the model to answer through the schema's tool"""
+    return {"type": "function", "function": {"name": model.__name__}}
+
+def repair_json(text):
+    """Best-effort repair of fenced, truncated or trailing-comma JSON text"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    start = text.find("{")
+    if start < 0:
+        return text
+    text = text[start:]
+
+    stack = []
+    in_string = False
+    escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return _TRAILING_COMMA.sub(r"\1", text[:index + 1])
+
+    # Truncated: close the open string, drop a dangling key, close containers
+    if in_string:
+        text += '"'
+    text = _DANGLING_KEY.sub("", text.rstrip()).rstrip().rstrip(",")
+    text += "".join(reversed(stack))
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+def parse_structured(text, model):
+    """Validate LLM output against the model, repairing the JSON if needed
+
+    Raises pydantic.ValidationError when the output cannot be salvaged.
+    """
+    try:
+        return model.model_validate_json(text)
+    except ValidationError as error:
+        repaired = repair_json(text or "")
+        if repaired == text:
+            raise
+        try:
+            return model.model_validate_json(repaired)
+        except ValidationError:
+            raise error
+
+def describe_errors(error):
+    """Summarise a validation error compactly for a re-ask prompt"""
+    lines = []
+    for item in error.errors()[:10]:
+        location = ".".join(str(part) for part in item["loc"]) or "<root>"
+        lines.append(f"- {location}: {item['msg']}")
+    return "\n".join(lines)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from sqlalchemy import create_engine
+import db_utils
+import queries
+from archive import archive_completed_loans
+from metrics import get_pipeline_metrics, rebuild_pipeline_metrics
+from models import Base, Document, LoanApplication
+
+# Archives a synthetic loan and checks it reads back unchanged. Run as
+# "python verify_archive.py"; it works in a temporary directory against its
+# own SQLite file, so neither the configured database nor ARCHIVE_DIR is
+# touched. Raises AssertionError on the first mismatch.
+
+def _queue_depth(metrics):
+    return {state: count for state, count in metrics["queue_depth"].items() if count}
+
+def verify_round_trip(workdir):
+    """Archive a loan and check queries.get_loan_view and the aggregates match the live state"""
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'verify.db')}")
+    Base.metadata.create_all(engine)
+    db_utils.Session.configure(bind=engine)
+    os.chdir(workdir)  # ARCHIVE_DIR is relative to the working directory
+
+    applicant_id = db_utils.create_applicant(name="Round Trip", email="round.trip@example.com")
+    loan_id = db_utils.create_loan_application(
+        applicant_id=applicant_id, loan_type="Personal", loan_amount=5000,
+        loan_purpose="Archive round trip", loan_term=24, application_data={"credit_score": 700}
+    )
+    db_utils.log_agent_interaction(
+        loan_application_id=loan_id,
+        agent_name="Application Intake Agent",
+        interaction_type="APPLICATION_VALIDATION",
+        input_data={"loan_amount": 5000},
+        output_data={"is_valid": True, "overall_assessment": "Round trip"}
+    )
+    session = db_utils.get_session()
+    session.add(Document(
+        loan_application_id=loan_id, document_type="identity", file_path="id.pdf",
+        verification_status="VERIFIED"
+    ))
+    session.commit()
+    session.close()
+    db_utils.update_loan_application_state(loan_id, "COMPLETED")
+    live = queries.load_loan_view(loan_id)
+
+    session = db_utils.get_session()
+    try:
+        archived = archive_completed_loans(session, cutoff_days=-1)
+        assert archived == 1, f"expected 1 archived loan, got {archived}"
+        assert session.get(LoanApplication, loan_id) is None, "loan row was not removed"
+
+        incremental = get_pipeline_metrics(session)
+        assert _queue_depth(incremental) == {}, f"archived loan still queued: {incremental['queue_depth']}"
+        rebuild_pipeline_metrics(session)
+        rebuilt = get_pipeline_metrics(session)
+        assert _queue_depth(rebuilt) == {}, f"rebuild queued archived loan: {rebuilt['queue_depth']}"
+        for name in ("dwell_times", "agents"):
+            assert incremental[name] == rebuilt[name], f"rebuilt {name} differ from incremental ones"
+    finally:
+        session.close()
+
+    view = queries.get_loan_view(loan_id)
+    assert view == live, f"archived view differs:\n{view}\n!=\n{live}"
+    assert view["documents"] and view["latest_validation"], "documents or validation missing"
+    assert queries.get_loan_status(loan_id)["validation_assessment"] == "Round trip"
+    assert db_utils.get_validation_result(loan_id) == "Round trip"
+
+if __name__ == "__main__":
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            verify_round_trip(workdir)
+        finally:
+            os.chdir(original_cwd)
+    print("Archive round trip OK")